@@ -3,36 +3,50 @@
 Simple standalone evaluation of Together AI Agent on HumanEvalFix.
 Uses Together AI's Llama-3.3-70B-Instruct-Turbo via API.
 """
-import json
+import logging
+import re
+import resource
+import signal
 import sys
 import os
-from tqdm import tqdm
-from collections import defaultdict
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from itertools import islice
+import orjson
 
 # Add parent to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.agent import TogetherCodeFixAgent
-from src.executor import CodeExecutor
+from src.executor import CodeExecutor, picklable_result
+from src.fix_cache import FixCache
+
+logger = logging.getLogger(__name__)
+
+# Separators for the per-problem report, built once
+_HRULE = "─" * 80
+_BANNER = "=" * 80
+
+# A test line is any line mentioning assert, without surrounding whitespace
+_ASSERT_LINE_RE = re.compile(r'^[ \t]*(.*assert.*?)[ \t\r]*$', re.M)
 
 
 def load_humanevalfix_dataset(limit=None):
-    """Load HumanEvalFix dataset from bigcode-evaluation-harness."""
+    """
+    Stream HumanEvalFix problems from bigcode-evaluation-harness.
+    
+    This is a generator: records are fetched and converted as the evaluation
+    consumes them, so the first problem can be sent to the agent before the
+    rest of the split has been read.
+    """
     from datasets import load_dataset
     
     # Load the dataset
-    print("Loading HumanEvalFix dataset...")
-    dataset = load_dataset("bigcode/humanevalpack", "python")['test']
+    logger.info("Streaming HumanEvalFix dataset...")
+    dataset = load_dataset("bigcode/humanevalpack", "python", split="test", streaming=True)
     
-    problems = []
-    for i, item in enumerate(dataset):
-        if limit and i >= limit:
-            break
-        
+    for i, item in enumerate(islice(dataset, limit)):
         # Extract COMPLETE buggy code with function signature
         declaration = item.get('declaration', '')
         buggy_solution = item.get('buggy_solution', '')
@@ -43,139 +57,353 @@ def load_humanevalfix_dataset(limit=None):
         buggy_code = declaration + buggy_solution
         
         # Parse tests into list
-        test_list = [line.strip() for line in tests.split('\n') if line.strip() and 'assert' in line]
+        test_list = _ASSERT_LINE_RE.findall(tests)
         
-        problems.append({
+        # Only what the agent and the test stage use; the raw declaration,
+        # solution and test source would just be extra copies of the same text
+        yield {
             'task_id': task_id,
             'buggy_code': buggy_code,  # Now includes function signature!
-            'declaration': declaration,
-            'buggy_solution': buggy_solution,
-            'tests': test_list,
-            'full_test_code': tests
-        })
+            'tests': test_list
+        }
+
+
+def _preview(text, limit):
+    """Truncate text for display, marking the cut with '...'."""
+    return text if len(text) <= limit else text[:limit] + "\n..."
+
+
+def cache_model_name(agent):
+    """Model part of the fix cache key: the main model, plus the draft model that makes the first attempts."""
+    draft_model_name = getattr(agent, 'draft_model_name', None)
+    if draft_model_name:
+        return f"{agent.model_name}+draft:{draft_model_name}x{agent.draft_iterations}"
+    return agent.model_name
+
+
+def batched(iterable, n):
+    """Yield lists of up to n items from iterable without materializing it."""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def fix_problems(agent, batch):
+    """
+    Run the agent on a batch of problems and time it (runs in a worker thread).
+    
+    Batches of more than one problem are sent in a single prompt via
+    fix_code_batch. Cache lookups happen before a batch gets here, and fixes
+    are only cached once they pass their tests.
     
-    print(f"Loaded {len(problems)} problems")
-    return problems
+    Returns:
+        List of (fixed_code, elapsed_seconds), one per problem
+    """
+    start_time = time.time()
+    fixes = agent.fix_code_batch(batch)
+    
+    elapsed = time.time() - start_time
+    return [(fixed_code, elapsed) for fixed_code in fixes]
+
+
+class TestTimeout(BaseException):
+    """Raised by SIGALRM in a test worker; BaseException so execute_code can't swallow it."""
+
+
+_worker_executor = None  # One CodeExecutor per test worker process
+
+
+def _raise_timeout(signum, frame):
+    raise TestTimeout()
+
 
+def init_test_worker(timeout, memory_limit_mb=None):
+    """Set up a persistent test worker: one executor, a timeout handler and an optional memory cap."""
+    global _worker_executor
+    _worker_executor = CodeExecutor(timeout=timeout)
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
 
-def evaluate_agent(agent, problems, verbose=True):
-    """Evaluate agent on problems."""
+
+def _noop(_):
+    return None
+
+
+def run_tests(fixed_code, tests):
+    """Run tests against a fix in a worker process, giving up after the executor's timeout."""
+    signal.alarm(_worker_executor.timeout)
+    try:
+        # The result is pickled back to the parent, so unpicklable values become reprs
+        return picklable_result(_worker_executor.execute_code(fixed_code, tests))
+    except TestTimeout:
+        return {
+            'success': False,
+            'error': f"Timeout: tests did not finish within {_worker_executor.timeout}s",
+            'tests_passed': 0,
+            'tests_total': len(tests)
+        }
+    finally:
+        signal.alarm(0)
+
+
+def evaluate_agent(agent, problems, max_workers=1, cache=None, batch_size=1, test_workers=None,
+                   details_file=None, test_timeout=5, test_memory_mb=None, show_snippets=False):
+    """
+    Evaluate agent on problems.
+    
+    problems may be any iterable (e.g. the load_humanevalfix_dataset
+    generator). Evaluation is a two-stage pipeline: the LLM calls are
+    I/O-bound, so up to max_workers batches of batch_size problems are sent
+    to the agent concurrently in threads; each returned fix is then tested in
+    a process pool of test_workers (default: CPU count), since running the
+    tests is CPU-bound. The test workers are long-lived, so each fix costs a
+    task hand-off rather than a process start; a fix whose tests run longer
+    than test_timeout seconds fails, and test_memory_mb optionally caps each
+    worker's address space. Cached fixes skip the agent and go straight to
+    the test stage. Only a bounded window of batches is pulled from problems
+    ahead of the workers. Results are reported as they complete, but
+    results['details'] keeps the original problem order.
+    
+    If details_file (opened in binary mode) is given, each problem's detail
+    is written to it as a JSON line as soon as it finishes (in completion
+    order) instead of being kept in memory, and results['details'] is left
+    empty.
+    
+    Per-problem reports go to the module logger at INFO level, so a WARNING
+    level (--quiet) skips building them and only the tqdm bar is shown.
+    Previews of the buggy and fixed code are only logged with show_snippets.
+    """
+    from tqdm import tqdm
+    from tqdm.contrib.logging import logging_redirect_tqdm
+    
+    num_problems = len(problems) if hasattr(problems, '__len__') else None
+    rate_limiter = getattr(agent, 'rate_limiter', None)
+    cache_model = cache_model_name(agent)
     results = {
-        'total': len(problems),
+        'total': 0,
         'passed': 0,
         'failed': 0,
         'details': []
     }
     
-    executor = CodeExecutor()
+    details = {}  # problem index -> detail, sorted at the end
     
-    print(f"\nEvaluating on {len(problems)} problems...")
-    print("=" * 80)
+    def record(i, detail):
+        if details_file is not None:
+            details_file.write(orjson.dumps(detail) + b"\n")
+            details_file.flush()  # Keep finished problems on disk if the run is interrupted
+        else:
+            details[i] = detail
     
-    for i, problem in enumerate(tqdm(problems, desc="Evaluating", disable=verbose)):
-        task_id = problem['task_id']
-        buggy_code = problem['buggy_code']
-        tests = problem['tests']
-        
-        print(f"\n{'='*80}")
-        print(f"Problem {i+1}/{len(problems)}: {task_id}")
-        print(f"{'='*80}")
+    logger.info("\nEvaluating on %s problems (%d worker(s), batch size %d)...\n%s",
+                num_problems if num_problems is not None else 'streamed', max_workers, batch_size, _BANNER)
+    
+    batches = batched(enumerate(problems), batch_size)
+    fixing = {}   # agent future -> batch of (index, problem)
+    testing = {}  # test future -> (index, problem, fixed_code, elapsed)
+    
+    n_test_workers = test_workers or os.cpu_count()
+    
+    def new_test_pool():
+        return ProcessPoolExecutor(max_workers=n_test_workers, initializer=init_test_worker,
+                                   initargs=(test_timeout, test_memory_mb))
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, ExitStack() as test_pools, \
+            logging_redirect_tqdm():
+        test_pool = test_pools.enter_context(new_test_pool())
         
-        # Show buggy code
-        print(f"\nBuggy Code:")
-        print("─" * 80)
-        print(buggy_code[:300] if len(buggy_code) > 300 else buggy_code)
-        if len(buggy_code) > 300:
-            print("...")
-        print("─" * 80)
+        def submit_test(i, problem, fixed_code, elapsed, from_cache=False):
+            nonlocal test_pool
+            try:
+                test_future = test_pool.submit(run_tests, fixed_code, problem['tests'])
+            except BrokenProcessPool as e:
+                # A test worker died (out of memory, segfault): this problem errors
+                # like the ones that were in flight, and testing goes on in a new pool
+                report(i, problem, fixed_code, elapsed, None, e, from_cache)
+                test_pool.shutdown(wait=False)
+                test_pool = test_pools.enter_context(new_test_pool())
+                return
+            testing[test_future] = (i, problem, fixed_code, elapsed, from_cache)
         
-        # Show tests
-        print(f"\nTests ({len(tests)} total):")
-        for j, test in enumerate(tests[:3], 1):
-            print(f"  {j}. {test}")
-        if len(tests) > 3:
-            print(f"  ... and {len(tests) - 3} more")
+        def refill():
+            """
+            Pull batches while both stages have room: each agent worker has a
+            batch queued behind it and the test pool has a few fixes waiting.
+            Cached fixes skip the agent stage and go straight to testing.
+            """
+            while len(fixing) < 2 * max_workers and len(testing) < 4 * n_test_workers:
+                batch = next(batches, None)
+                if batch is None:
+                    return
+                misses = []
+                for i, problem in batch:
+                    fixed_code = None
+                    if cache is not None:
+                        fixed_code = cache.get(cache_model, problem['buggy_code'], problem['tests'])
+                    if fixed_code is None:
+                        misses.append((i, problem))
+                    else:
+                        submit_test(i, problem, fixed_code, 0.0, from_cache=True)
+                if misses:
+                    future = pool.submit(fix_problems, agent, [problem for _, problem in misses])
+                    fixing[future] = misses
         
-        # Get fix from agent
-        print(f"\nAgent is working...")
-        try:
-            import time
-            start_time = time.time()
+        def report(i, problem, fixed_code, elapsed, result, error, from_cache=False):
+            """
+            Log and record one finished problem (error is set if fixing or testing raised).
             
-            fixed_code = agent.fix_code(
-                buggy_code=buggy_code,
-                test_cases=tests,
-                task_id=task_id
-            )
+            A new fix that passes its tests is cached; a cached fix that no
+            longer passes is dropped, so the next run fixes it again.
+            """
+            results['total'] += 1
+            task_id = problem['task_id']
+            buggy_code = problem['buggy_code']
+            tests = problem['tests']
+            show = logger.isEnabledFor(logging.INFO)
             
-            elapsed = time.time() - start_time
+            if show:
+                logger.info("\n%s\nProblem %d/%s: %s\n%s", _BANNER, i + 1, num_problems or '?', task_id, _BANNER)
+                
+                # Show buggy code (previews are only built on request)
+                if show_snippets:
+                    logger.info("\nBuggy Code:\n%s\n%s\n%s", _HRULE, _preview(buggy_code, 300), _HRULE)
+                
+                # Show tests
+                test_lines = [f"  {j}. {test}" for j, test in enumerate(tests[:3], 1)]
+                if len(tests) > 3:
+                    test_lines.append(f"  ... and {len(tests) - 3} more")
+                logger.info("\nTests (%d total):\n%s", len(tests), "\n".join(test_lines))
+                
+                # Show fixed code
+                if show_snippets and fixed_code is not None:
+                    logger.info("\nFixed Code (took %.1fs):\n%s\n%s\n%s", elapsed, _HRULE,
+                                _preview(fixed_code, 300), _HRULE)
             
-            # Show fixed code
-            print(f"\nFixed Code (took {elapsed:.1f}s):")
-            print("─" * 80)
-            print(fixed_code[:300] if len(fixed_code) > 300 else fixed_code)
-            if len(fixed_code) > 300:
-                print("...")
-            print("─" * 80)
-            
-            # Test the fixed code
-            print(f"\nRunning tests...")
-            result = executor.execute_code(fixed_code, tests)
-            passed = result.get('tests_passed', 0)
-            total = result.get('tests_total', len(tests))
-            
-            # CRITICAL: If no tests were run, that's a failure!
-            if total == 0 or not result.get('success', False):
-                success = False
-            else:
-                success = (passed == total)
-            
-            if success:
-                results['passed'] += 1
-                status = f"PASS - All {total} tests passed!"
-                print(f"\n{status}")
-            else:
+            if error is not None:
                 results['failed'] += 1
-                # Better error messages
-                if total == 0:
-                    status = f"FAIL - No tests could be run! Code is likely invalid."
+                error_msg = str(error)
+                logger.warning("%s: ERROR: %s", task_id, error_msg[:200])
+                
+                record(i, {
+                    'task_id': task_id,
+                    'success': False,
+                    'buggy_code': buggy_code,
+                    'error': error_msg
+                })
+            else:
+                passed = result.get('tests_passed', 0)
+                total = result.get('tests_total', len(tests))
+                
+                # CRITICAL: If no tests were run, that's a failure!
+                if total == 0 or not result.get('success', False):
+                    success = False
                 else:
-                    status = f"FAIL - {passed}/{total} tests passed"
-                print(f"\n{status}")
-                if result.get('error'):
-                    print(f"\nError:")
-                    print(result['error'][:500])
-            
-            results['details'].append({
-                'task_id': task_id,
-                'success': success,
-                'tests_passed': passed,
-                'tests_total': total,
-                'elapsed_time': elapsed,
-                'buggy_code': buggy_code,
-                'fixed_code': fixed_code,
-                'error': result.get('error', None) if not success else None
-            })
-            
-        except Exception as e:
-            results['failed'] += 1
-            error_msg = str(e)
-            print(f"\nERROR: {error_msg[:200]}")
+                    success = (passed == total)
+                
+                if cache is not None:
+                    if success and not from_cache:
+                        cache.set(cache_model, buggy_code, tests, fixed_code)
+                    elif from_cache and not success:
+                        cache.discard(cache_model, buggy_code, tests)
+                
+                if success:
+                    results['passed'] += 1
+                    logger.info("\nPASS - All %d tests passed!", total)
+                else:
+                    results['failed'] += 1
+                    # Better error messages
+                    if total == 0:
+                        logger.info("\nFAIL - No tests could be run! Code is likely invalid.")
+                    else:
+                        logger.info("\nFAIL - %d/%d tests passed", passed, total)
+                    if show and result.get('error'):
+                        logger.info("\nError:\n%s", result['error'][:500])
+                
+                record(i, {
+                    'task_id': task_id,
+                    'success': success,
+                    'tests_passed': passed,
+                    'tests_total': total,
+                    'elapsed_time': elapsed,
+                    'buggy_code': buggy_code,
+                    'fixed_code': fixed_code,
+                    'error': result.get('error', None) if not success else None
+                })
             
-            results['details'].append({
-                'task_id': task_id,
-                'success': False,
-                'buggy_code': buggy_code,
-                'error': error_msg
-            })
+            # The running pass rate lives on the progress bar, redrawn at most once per mininterval
+            postfix = {'pass_rate': f"{results['passed'] / results['total']:.1%}"}
+            if rate_limiter is not None:
+                postfix['rpm'] = f"{rate_limiter.effective_rpm():.0f}"
+            progress.set_postfix(postfix, refresh=False)
+            progress.update(1)
         
-        print(f"\n{'='*80}")
-        print(f"Progress: {results['passed']}/{i+1} passed ({results['passed']/(i+1)*100:.1f}%)")
-        print(f"{'='*80}\n")
+        # Start the test workers now so the first fixes don't wait on process startup
+        list(test_pool.map(_noop, range(n_test_workers)))
+        
+        progress = tqdm(total=num_problems, desc="Evaluating", mininterval=1.0)
+        refill()
+        while fixing or testing:
+            finished, _ = wait([*fixing, *testing], return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in testing:
+                    i, problem, fixed_code, elapsed, from_cache = testing.pop(future)
+                    try:
+                        report(i, problem, fixed_code, elapsed, future.result(), None, from_cache)
+                    except Exception as e:
+                        report(i, problem, fixed_code, elapsed, None, e, from_cache)
+                    refill()
+                    continue
+                
+                batch = fixing.pop(future)
+                try:
+                    outcomes = future.result()
+                except Exception as e:
+                    outcomes = [e] * len(batch)
+                
+                # Hand each fix to the test stage
+                for (i, problem), outcome in zip(batch, outcomes):
+                    if isinstance(outcome, Exception):
+                        report(i, problem, None, None, None, outcome)
+                        continue
+                    fixed_code, elapsed = outcome
+                    submit_test(i, problem, fixed_code, elapsed)
+                refill()
+        progress.close()
     
+    results['details'] = [details[i] for i in sorted(details)]
     return results
 
 
+def load_completed(path):
+    """
+    Read an existing JSON Lines results file.
+    
+    Problems that failed with an exception (API outage, network drop) were
+    never tested and are left out, so a resumed run retries them.
+    
+    Returns:
+        Dict of task_id -> success for every problem already evaluated
+    """
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                detail = orjson.loads(line)
+            except ValueError:
+                continue  # Partial last line from an interrupted run
+            if 'tests_total' not in detail:
+                continue  # Crashed before testing; retry it
+            completed[detail['task_id']] = detail['success']
+    return completed
+
+
 def print_summary(results):
     """Print evaluation summary."""
     print("\n" + "=" * 80)
@@ -200,15 +428,60 @@ def main():
     
     parser = argparse.ArgumentParser(description="Evaluate Together AI Agent on HumanEvalFix")
     parser.add_argument("--limit", type=int, default=None, help="Limit number of problems to evaluate")
-    parser.add_argument("--output", type=str, default="humanevalfix_results.json", help="Output file for results")
+    parser.add_argument("--output", type=str, default="humanevalfix_results.jsonl",
+                        help="JSON Lines file for per-problem results (appended to, so runs can resume)")
+    parser.add_argument("--summary-output", type=str, default="humanevalfix_summary.json",
+                        help="Output file for the final pass/fail tallies")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Start a fresh results file instead of skipping problems already in it")
     parser.add_argument("--quiet", action="store_true", help="Suppress verbose output")
+    parser.add_argument("--verbose-snippets", action="store_true",
+                        help="Show the first 300 characters of each buggy and fixed function")
     parser.add_argument("--model", type=str, default="meta-llama/Llama-3.3-70B-Instruct-Turbo", 
                         help="Together AI model to use")
+    parser.add_argument("--draft-model", type=str, default=None,
+                        help="Cheaper Together AI model tried first; --model takes over after --draft-iterations failed attempts")
+    parser.add_argument("--draft-iterations", type=int, default=2,
+                        help="Attempts per problem made by --draft-model before switching to --model (default: 2)")
     parser.add_argument("--api-key", type=str, default=None, 
                         help="Together API key (or set TOGETHER_API_KEY env var)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Number of problems sent to the agent concurrently")
+    parser.add_argument("--speculative", type=int, default=1,
+                        help="Race this many requests per agent iteration across keys/temperatures, keeping the first usable one")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream API replies and stop reading early when the submitted code doesn't compile")
+    parser.add_argument("--rpm", type=int, default=500,
+                        help="Maximum Together API requests per minute across all workers (0 = unlimited)")
+    parser.add_argument("--test-workers", type=int, default=None,
+                        help="Processes used to run tests on fixes (default: CPU count)")
+    parser.add_argument("--test-timeout", type=int, default=5,
+                        help="Seconds a fix's tests may run before it is marked as failed")
+    parser.add_argument("--test-memory-mb", type=int, default=None,
+                        help="Address-space limit for each test worker process (default: unlimited)")
+    parser.add_argument("--cache-dir", type=str, default=".fixcache",
+                        help="Directory for cached agent fixes")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always call the API instead of reusing cached fixes")
+    parser.add_argument("--exact-cache", action="store_true",
+                        help="Key the cache on the exact code instead of its comment/whitespace-normalized form")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Problems packed into one prompt (fixes failing their tests are retried individually)")
     
     args = parser.parse_args()
     
+    # Heavy imports wait until the arguments are known to be valid (keeps --help fast)
+    from dotenv import load_dotenv
+    from src.agent import TogetherCodeFixAgent
+    
+    # Load environment variables
+    load_dotenv()
+    
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # No "HTTP Request: POST ..." line per API call
+    if args.workers == 1 and not args.quiet:
+        logging.getLogger("src.agent").setLevel(logging.DEBUG)  # Show the verbose agent's details
+    
     print("="*80)
     print("Together AI Agent - HumanEvalFix Evaluation")
     print("="*80)
@@ -216,7 +489,14 @@ def main():
     print("Configuration:")
     print(f"   Problems: {args.limit if args.limit else 'all'}")
     print(f"   Model: {args.model}")
-    print(f"   Output: {args.output}")
+    if args.draft_model:
+        print(f"   Draft model: {args.draft_model} (first {args.draft_iterations} attempts)")
+    print(f"   Workers: {args.workers}")
+    print(f"   Rate limit: {f'{args.rpm} requests/min' if args.rpm else 'none'}")
+    print(f"   Batch size: {args.batch_size}")
+    print(f"   Test workers: {args.test_workers or os.cpu_count()}")
+    print(f"   Cache: {'disabled' if args.no_cache else args.cache_dir}")
+    print(f"   Output: {args.output} (summary: {args.summary_output})")
     
     # Check API key
     api_key = args.api_key or os.getenv("TOGETHER_API_KEY")
@@ -230,25 +510,55 @@ def main():
     
     print("   Together API key found")
     
-    # Load dataset
+    # Load dataset, skipping problems finished by a previous interrupted run
     problems = load_humanevalfix_dataset(limit=args.limit)
+    completed = {} if args.no_resume else load_completed(args.output)
+    in_range = set()  # Task ids within --limit, filled in as the problems are read
+    
+    def pending(problems):
+        for problem in problems:
+            in_range.add(problem['task_id'])
+            if problem['task_id'] not in completed:
+                yield problem
+    
+    if completed:
+        print(f"   Resuming: {len(completed)} problems already in {args.output}")
+        problems = pending(problems)
     
     # Create agent
     print(f"\nInitializing Together AI Agent...")
     agent = TogetherCodeFixAgent(
         api_key=api_key,
         model_name=args.model,
-        verbose=True  # Always show agent details during eval
+        verbose=args.workers == 1 and not args.quiet,  # Agent details are only readable when run sequentially
+        requests_per_minute=args.rpm or None,
+        speculative_calls=args.speculative,
+        stream_responses=args.stream,
+        draft_model_name=args.draft_model,
+        draft_iterations=args.draft_iterations
     )
     
-    # Evaluate
-    results = evaluate_agent(agent, problems, verbose=not args.quiet)
+    cache = None if args.no_cache else FixCache(args.cache_dir, normalize=not args.exact_cache)
+    
+    # Evaluate, appending each problem's result as it finishes
+    with agent, open(args.output, 'wb' if args.no_resume else 'ab') as details_file:
+        results = evaluate_agent(agent, problems, max_workers=args.workers, cache=cache,
+                                 batch_size=args.batch_size, test_workers=args.test_workers,
+                                 details_file=details_file, test_timeout=args.test_timeout,
+                                 test_memory_mb=args.test_memory_mb, show_snippets=args.verbose_snippets)
+    
+    # Fold in the problems of this --limit range finished by earlier runs
+    earlier = [completed[task_id] for task_id in in_range if task_id in completed]
+    results['total'] += len(earlier)
+    results['passed'] += sum(earlier)
+    results['failed'] += len(earlier) - sum(earlier)
+    del results['details']
     
-    # Save results
-    with open(args.output, 'w') as f:
-        json.dump(results, f, indent=2)
+    with open(args.summary_output, 'wb') as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
     
     print(f"\nResults saved to: {args.output}")
+    print(f"Summary saved to: {args.summary_output}")
     
     # Print summary
     print_summary(results)
@@ -5,20 +5,17 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from src.commitpack_loader import (
-    download_and_filter_commitpack,
-    load_commitpack_python,
-    convert_to_bugfix_format
-)
-from src.local_agent import LocalCodeFixAgent
-from src.executor import CodeExecutor
-from tqdm import tqdm
 import time
 import argparse
 
+# Dataset, model and tqdm imports are deferred to the functions that use
+# them, so --help and the usage message don't pay for loading them.
+
 
 def download_dataset(max_samples: int = 1000):
     """Download and filter CommitPackFT dataset."""
+    from src.commitpack_loader import download_and_filter_commitpack
+    
     print("="*70)
     print("DOWNLOADING COMMITPACKFT DATASET")
     print("="*70)
@@ -48,6 +45,10 @@ def evaluate_on_commitpack(
         num_samples: Number of samples to evaluate
         use_sample: Use sample data instead of full dataset
     """
+    from tqdm import tqdm
+    from src.commitpack_loader import load_commitpack_python, convert_to_bugfix_format
+    from src.local_agent import LocalCodeFixAgent
+    from src.executor import CodeExecutor
     
     print("="*70)
     print("EVALUATING AGENT ON COMMITPACKFT")
@@ -59,10 +60,11 @@ def evaluate_on_commitpack(
         max_samples=num_samples
     )
     
-    # Convert to bug-fix format
-    problems = [convert_to_bugfix_format(ex) for ex in commit_examples]
+    # Convert to bug-fix format lazily, one example at a time as it is evaluated
+    num_problems = len(commit_examples)
+    problems = (convert_to_bugfix_format(ex) for ex in commit_examples)
     
-    print(f"\nEvaluating on {len(problems)} code change examples")
+    print(f"\nEvaluating on {num_problems} code change examples")
     print(f"Model: {model_name}\n")
     
     # Initialize agent
@@ -74,7 +76,7 @@ def evaluate_on_commitpack(
     exact_matches = 0
     syntax_valid = 0
     
-    for i, problem in enumerate(tqdm(problems, desc="Processing")):
+    for i, problem in enumerate(tqdm(problems, total=num_problems, desc="Processing")):
         print(f"\n{'-'*70}")
         print(f"{i+1}. {problem['task_id']}")
         print(f"   Change: {problem['prompt']}")
@@ -3,11 +3,147 @@ Code fixing agent using Together AI with Llama-3.3-70B-Instruct-Turbo
 Uses function calling for run_code tool.
 """
 from typing import List, Dict, Optional
+import hashlib
 import time
 import json
+import logging
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from string import Template
+import httpx
 from together import Together
+from together.types.chat import ChatCompletion
 from .executor import CodeExecutor
+from .rate_limit import RateLimiter, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+_RULE = "=" * 70  # Separator in the verbose output
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib json module
+    orjson = None
+
+
+def _json_loads(data):
+    """Parse tool-call arguments (orjson when available)."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    """Serialize a tool result to str (orjson when available)."""
+    if orjson:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            pass  # e.g. ints wider than 64 bits in expected/actual values
+    return json.dumps(obj)
+
+
+# Static prompt text is built once at import so every request sends a
+# byte-identical prefix, which lets the provider reuse its prompt cache.
+# Task-specific text (buggy code, tests) must only go in the user message.
+SYSTEM_PROMPT = """You are an expert Python debugging agent with access to a code execution sandbox.
+
+YOUR MISSION: Fix buggy Python code by analyzing it, identifying bugs, and testing fixes iteratively.
+
+AVAILABLE TOOL:
+- run_code(code: str, reason: str): Executes your code against predefined test cases
+  Returns: {"success": bool, "tests_passed": int, "tests_total": int, "error": str}
+
+WORKFLOW:
+1. READ the buggy code carefully
+2. ANALYZE what tests expect vs what code does
+3. IDENTIFY the bug(s)
+4. CALL run_code with your fixed code + brief explanation
+5. READ the test results:
+   - All pass -> STOP (you're done!)
+   - Some fail -> Analyze failures, try DIFFERENT fix, go to step 4
+6. ITERATE until all tests pass (max 10 attempts)
+
+CRITICAL RULES:
+- ALWAYS call run_code - never just explain the fix
+- Each attempt must try something DIFFERENT (don't repeat same code)
+- Read error messages carefully - they tell you what's wrong
+- When all tests pass, STOP immediately (don't call again)
+- Keep your 'reason' brief (1 sentence) - save tokens for code
+
+COMMON BUG PATTERNS & FIXES:
+1. Missing absolute value:
+   Bug: distance = elem1 - elem2
+   Fix: distance = abs(elem1 - elem2)
+
+2. Wrong comparison operator:
+   Bug: if distance < threshold (when should be <=)
+   Fix: if distance <= threshold
+
+3. Off-by-one in loops:
+   Bug: for i in range(len(arr) - 1)
+   Fix: for i in range(len(arr))
+
+4. Not handling spaces/whitespace:
+   Bug: for c in string: process(c)
+   Fix: for c in string: if c != ' ': process(c)
+
+5. Adding instead of just returning:
+   Bug: return value + 1.0
+   Fix: return value
+
+EXAMPLE FIX:
+Buggy: def has_close(nums, threshold): return any(n1-n2 < threshold for n1 in nums for n2 in nums)
+Fixed: def has_close(nums, threshold): return any(abs(n1-n2) < threshold for i, n1 in enumerate(nums) for j, n2 in enumerate(nums) if i != j)
+Reason: Added abs() and excluded same-element comparisons
+
+NOW: Call run_code with your first fix attempt!"""
+
+USER_PROMPT_TEMPLATE = Template("""BUGGY CODE TO FIX:
+
+```python
+$buggy_code
+```
+$test_info
+
+TASK: Fix the bug(s) in this code so it passes ALL test cases.
+
+ACTION: Call run_code NOW with:
+  - code: Your complete fixed version
+  - reason: One sentence explaining what you changed
+
+START NOW - Don't explain, just call the function!""")
+
+BATCH_SYSTEM_PROMPT = "You are an expert Python debugging agent. Fix bugs precisely and answer in the requested JSON format only."
+
+# The run_code tool schema is rendered into the prompt ahead of the system
+# message, so it is shared by every agent to keep that prefix identical too.
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "run_code",
+            "description": "Execute Python code in a sandbox and test it against predefined test cases. This is your ONLY way to verify fixes. Call this with your fixed code to see if tests pass. Returns test results with pass/fail status and error details if any tests fail.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "code": {
+                        "type": "string",
+                        "description": "Complete, executable Python code with all imports, function definitions, and the fix applied. Must be syntactically valid Python."
+                    },
+                    "reason": {
+                        "type": "string",
+                        "description": "Brief one-sentence explanation of what bug you identified and what change you made to fix it. Example: 'Added abs() to calculate absolute distance between elements'"
+                    }
+                },
+                "required": ["code", "reason"]
+            }
+        }
+    }
+]
+
+# Forces a run_code call, so a first reply can't be an explanation without code
+FORCE_RUN_CODE = {"type": "function", "function": {"name": "run_code"}}
 
 
 class AgentObserver:
@@ -16,6 +152,9 @@ class AgentObserver:
     def __init__(self, verbose: bool = True):
         self.verbose = verbose
         self.logs = []
+        # Maintained alongside logs so get_summary doesn't rescan them
+        self._actions = []
+        self._errors = []
         self.start_time = None
         
     def start_session(self, task_id: str):
@@ -37,6 +176,9 @@ class AgentObserver:
             'data': data or {}
         }
         self.logs.append(log_entry)
+        self._actions.append(action)
+        if level == 'ERROR':
+            self._errors.append(log_entry)
         
         if self.verbose:
             prefix = {
@@ -48,105 +190,133 @@ class AgentObserver:
                 'SUCCESS': '  [SUCCESS]'
             }.get(level, '  [LOG]')
             
-            print(f"{prefix} {message}")
+            logger.debug("%s %s", prefix, message)
     
     def get_summary(self) -> Dict:
         """Get summary of the session."""
         return {
             'total_logs': len(self.logs),
             'total_time': time.time() - self.start_time if self.start_time else 0,
-            'actions': [log['action'] for log in self.logs],
-            'errors': [log for log in self.logs if log['level'] == 'ERROR']
+            'actions': self._actions,
+            'errors': self._errors
         }
 
 
-# Global references for tool dependencies
-_test_cases = []
-_observer = None
-_previous_code = None  # Track previous code submission
+# CodeExecutor keeps no per-call state, so one instance serves every thread
+_EXECUTOR = CodeExecutor()
+
+# The "code" argument of a streamed run_code call, once its closing quote has arrived
+_CODE_ARGUMENT_RE = re.compile(r'"code"\s*:\s*("(?:[^"\\]|\\.)*")')
 
 
-def run_code_tool(code: str, reason: str) -> Dict:
+def make_run_code_tool(test_cases: List[str], observer: Optional[AgentObserver] = None):
     """
-    Execute Python code in sandbox and return results.
-    This is the actual function that gets called when LLM invokes the tool.
+    Build the run_code tool for one fix_code session.
     
-    Args:
-        code: Complete executable Python code
-        reason: Brief explanation of what bug was fixed
-    
-    Returns:
-        Dict with success status and test results
+    The returned function closes over the session's test cases, observer and
+    the results of earlier submissions, so concurrent sessions never share state.
     """
-    global _test_cases, _observer, _previous_code
-    
-    if not code:
-        return {'success': False, 'error': 'No code provided'}
+    # Results of every submission this session, keyed by code hash, and the
+    # attempt number each hash was first submitted in
+    result_cache = {}
+    first_attempt = {}
+    attempts = 0
     
-    # Check if this is the same code as before (detect loops)
-    if _previous_code is not None and code.strip() == _previous_code.strip():
-        warning_msg = "WARNING: You submitted the EXACT SAME code as your previous attempt!"
-        warning_msg += "\n\nYou're stuck in a loop! The tests are failing, which means your fix didn't work."
-        warning_msg += "\n\nTry a DIFFERENT approach:"
-        warning_msg += "\n  - Re-read the test failures carefully"
-        warning_msg += "\n  - Think about what ELSE could cause those failures"
-        warning_msg += "\n  - Try a completely different fix"
-        
-        if _observer:
-            _observer.log("DUPLICATE_CODE", "Same code submitted twice!", level="ERROR")
+    def run_code_tool(code: str, reason: str) -> Dict:
+        """
+        Execute Python code in sandbox and return results.
+        This is the actual function that gets called when LLM invokes the tool.
         
-        return {
-            'success': False,
-            'error': warning_msg,
-            'duplicate_submission': True
-        }
-    
-    # Store this code for next time
-    _previous_code = code
-    
-    if _observer:
-        _observer.log("TOOL_CALLED", "LLM CALLED run_code TOOL!", level="TOOL")
-        _observer.log("TOOL_EXECUTE", f"Running code ({len(code)} chars)...", level="TOOL")
-        print("\n" + "="*70)
-        print("TOOL CALL DETECTED!")
-        print(f"   Tool: run_code")
-        print(f"   Reason: {reason}")
-        print(f"   Code length: {len(code)} chars")
-        print(f"\nCode received by tool:")
-        print("─" * 70)
-        print(code)
-        print("─" * 70)
-        print("="*70 + "\n")
+        Args:
+            code: Complete executable Python code
+            reason: Brief explanation of what bug was fixed
+        
+        Returns:
+            Dict with success status and test results
+        """
+        nonlocal attempts
+        if not code:
+            return {'success': False, 'error': 'No code provided'}
+        attempts += 1
+        
+        # Check if this code was already tried this session (detect loops, even A -> B -> A)
+        code_hash = hashlib.blake2b(code.strip().encode('utf-8'), digest_size=16).digest()
+        if code_hash in result_cache:
+            warning_msg = f"WARNING: You already tried this EXACT code in attempt #{first_attempt[code_hash]}!"
+            warning_msg += "\n\nYou're stuck in a loop! The tests are failing, which means your fix didn't work."
+            warning_msg += "\n\nTry a DIFFERENT approach:"
+            warning_msg += "\n  - Re-read the test failures carefully"
+            warning_msg += "\n  - Think about what ELSE could cause those failures"
+            warning_msg += "\n  - Try a completely different fix"
+            
+            if observer:
+                observer.log("DUPLICATE_CODE", f"Attempt {attempts} repeats attempt {first_attempt[code_hash]} - reusing its result", level="ERROR")
+            
+            # Reuse the earlier result instead of re-running the sandbox
+            result = dict(result_cache[code_hash])
+            previous_error = result.get('error')
+            result['error'] = warning_msg + (f"\n\nResult of that attempt:\n{previous_error}" if previous_error else "")
+            result['duplicate_submission'] = True
+            result['cached'] = True
+            return result
+        
+        result = _run_submission(code, reason, test_cases, observer)
+        result_cache[code_hash] = result
+        first_attempt[code_hash] = attempts
+        return result
     
-    executor = CodeExecutor()
+    return run_code_tool
+
+
+def _run_submission(code: str, reason: str, test_cases: List[str], observer: Optional[AgentObserver]) -> Dict:
+    """Validate and test a submission (the uncached part of run_code_tool)."""
+    verbose = observer is not None and observer.verbose  # Detail output belongs to verbose agents
+    if observer:
+        observer.log("TOOL_CALLED", "LLM CALLED run_code TOOL!", level="TOOL")
+        observer.log("TOOL_EXECUTE", f"Running code ({len(code)} chars)...", level="TOOL")
+    if verbose and logger.isEnabledFor(logging.DEBUG):
+        # One record per block, so concurrent sessions don't interleave mid-block
+        logger.debug("\n".join([
+            "\n" + _RULE,
+            "TOOL CALL DETECTED!",
+            f"   Tool: run_code",
+            f"   Reason: {reason}",
+            f"   Code length: {len(code)} chars",
+            f"\nCode received by tool:",
+            "─" * 70,
+            code,
+            "─" * 70,
+            _RULE + "\n",
+        ]))
     
     # Validate syntax
-    is_valid, syntax_error = executor.validate_code(code)
+    is_valid, syntax_error = _EXECUTOR.validate_code(code)
     
     if not is_valid:
         error_msg = f"Syntax Error:\n{syntax_error}"
-        if _observer:
-            _observer.log("SYNTAX_ERROR", syntax_error, level="ERROR")
-            print(f"\n{error_msg}\n")
+        if observer:
+            observer.log("SYNTAX_ERROR", syntax_error, level="ERROR")
+        if verbose:
+            logger.debug("\n%s\n", error_msg)
         return {'success': False, 'error': error_msg}
     
-    if _observer:
-        print("Syntax valid - running tests...\n")
-        print(f"DEBUG: _test_cases has {len(_test_cases)} tests")
-        if _test_cases:
-            print(f"   First test: {_test_cases[0]}")
+    if verbose:
+        logger.debug("Syntax valid - running tests...\n")
+        logger.debug("DEBUG: test_cases has %d tests", len(test_cases))
+        if test_cases:
+            logger.debug("   First test: %s", test_cases[0])
     
     # Run tests
-    if _test_cases:
-        result = executor.execute_code(code, _test_cases)
+    if test_cases:
+        result = _EXECUTOR.execute_code_with_timeout(code, test_cases)
         passed = result.get('tests_passed', 0)
-        total = result.get('tests_total', len(_test_cases))
+        total = result.get('tests_total', len(test_cases))
         failed_tests = result.get('failed_tests', [])
         
         if passed == total and passed > 0:
             msg = f"SUCCESS! All {total} tests passed!"
-            if _observer:
-                _observer.log("ALL_PASS", msg, level="SUCCESS")
+            if observer:
+                observer.log("ALL_PASS", msg, level="SUCCESS")
             return {
                 'success': True,
                 'tests_passed': passed,
@@ -182,8 +352,8 @@ def run_code_tool(code: str, reason: str) -> Dict:
             
             error_msg = "\n".join(failure_details)
             
-            if _observer:
-                _observer.log("TESTS_FAILED", f"{passed}/{total} passed", level="ERROR")
+            if observer:
+                observer.log("TESTS_FAILED", f"{passed}/{total} passed", level="ERROR")
             
             return {
                 'success': False,
@@ -195,19 +365,55 @@ def run_code_tool(code: str, reason: str) -> Dict:
             }
     else:
         # No tests - just validate it runs
-        result = executor.execute_code(code, ["pass"])
+        result = _EXECUTOR.execute_code_with_timeout(code, ["pass"])
         if result.get('error'):
             msg = f"Runtime Error:\n{result['error']}"
-            if _observer:
-                _observer.log("RUNTIME_ERROR", result['error'], level="ERROR")
+            if observer:
+                observer.log("RUNTIME_ERROR", result['error'], level="ERROR")
             return {'success': False, 'error': msg}
         else:
             msg = "Code runs without errors!"
-            if _observer:
-                _observer.log("NO_ERROR", msg, level="SUCCESS")
+            if observer:
+                observer.log("NO_ERROR", msg, level="SUCCESS")
             return {'success': True, 'message': msg}
 
 
+def _summarize_tool_result(content: str) -> str:
+    """One-line summary of a run_code result that is being dropped from the history."""
+    try:
+        result = _json_loads(content)
+    except ValueError:
+        return "[prior attempt summary: unreadable result]"
+    if 'tests_total' in result:
+        summary = f"{result.get('tests_passed', 0)}/{result['tests_total']} passed"
+        failed_tests = result.get('failed_tests')
+        if failed_tests:
+            summary += f", failing on: {failed_tests[0]['test']} ({failed_tests[0]['error']})"
+    else:
+        error = (result.get('error') or '').strip()
+        summary = error.splitlines()[0] if error else "ran without errors"
+    return f"[prior attempt summary: {summary}]"
+
+
+def _prune_messages(messages: List, keep_last: int = 4) -> None:
+    """
+    Bound the history to the prompt plus the last keep_last attempts, in place.
+    
+    Each attempt starts at an assistant message. Older attempts are replaced by
+    a one-line user message per tool result, so the model still knows what it
+    already tried without re-sending every full code dump and failure report.
+    """
+    starts = [i for i, msg in enumerate(messages)
+              if (msg.get('role') if isinstance(msg, dict) else msg.role) == 'assistant']
+    if len(starts) <= keep_last:
+        return
+    cut = starts[-keep_last]
+    summaries = [{"role": "user", "content": _summarize_tool_result(msg['content'])}
+                 for msg in messages[starts[0]:cut]
+                 if isinstance(msg, dict) and msg.get('role') == 'tool']
+    messages[starts[0]:cut] = summaries
+
+
 class TogetherCodeFixAgent:
     """Code fixing agent using Together AI with Llama-3.3-70B and function calling"""
     
@@ -215,12 +421,30 @@ class TogetherCodeFixAgent:
                  api_key: str = None,
                  model_name: str = "meta-llama/Llama-3.3-70B-Instruct-Turbo",
                  max_iterations: int = 10,
-                 verbose: bool = True):
+                 verbose: bool = True,
+                 requests_per_minute: Optional[int] = None,
+                 speculative_calls: int = 1,
+                 history_window: int = 4,
+                 stream_responses: bool = False,
+                 draft_model_name: Optional[str] = None,
+                 draft_iterations: int = 2):
         api_keys_raw = api_key or os.getenv("TOGETHER_API_KEY")
         self.model_name = model_name
+        # Optional cheaper model for the first draft_iterations attempts; the main model takes over after
+        self.draft_model_name = draft_model_name
+        self.draft_iterations = draft_iterations
         self.max_iterations = max_iterations
         self.verbose = verbose
+        # Agent details are logged at DEBUG level, and only by verbose agents;
+        # the entry script decides whether DEBUG records are shown
         self.observer = AgentObserver(verbose=verbose)
+        # Shared by every thread using this agent, so concurrent fixes stay under the RPM limit together
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        
+        # With speculative_calls > 1, each iteration races that many requests
+        # (different keys and temperatures) and keeps the first usable answer
+        self.speculative_calls = speculative_calls
+        self._speculative_pool = ThreadPoolExecutor(max_workers=32) if speculative_calls > 1 else None
         
         if not api_keys_raw:
             raise ValueError("Together API key required! Set TOGETHER_API_KEY env var or pass api_key parameter")
@@ -231,49 +455,207 @@ class TogetherCodeFixAgent:
         if not self.api_keys:
             raise ValueError("No valid API keys found!")
         
-        # Create multiple clients for round-robin usage
-        self.clients = [Together(api_key=key) for key in self.api_keys]
+        # One pooled keep-alive HTTP client shared by every key, so concurrent
+        # and repeated calls reuse open connections instead of new TLS handshakes
+        self._http_client = httpx.Client(
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+        
+        # Create multiple clients for round-robin usage. The SDK's own retries are
+        # off: they would sleep out a 429 in one thread while the others keep
+        # sending, so retries go through the shared rate limiter below instead.
+        self.clients = [Together(api_key=key, http_client=self._http_client, max_retries=0)
+                        for key in self.api_keys]
         self.current_client_index = 0
+        self._client_lock = threading.Lock()
         
         if self.verbose and len(self.api_keys) > 1:
-            print(f"Loaded {len(self.api_keys)} API keys for round-robin usage")
+            logger.debug("Loaded %d API keys for round-robin usage", len(self.api_keys))
         
         # For backward compatibility
         self.client = self.clients[0]
         self.api_key = self.api_keys[0]
         
-        # Define the run_code tool for function calling
-        self.tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "run_code",
-                    "description": "Execute Python code in a sandbox and test it against predefined test cases. This is your ONLY way to verify fixes. Call this with your fixed code to see if tests pass. Returns test results with pass/fail status and error details if any tests fail.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "code": {
-                                "type": "string",
-                                "description": "Complete, executable Python code with all imports, function definitions, and the fix applied. Must be syntactically valid Python."
-                            },
-                            "reason": {
-                                "type": "string",
-                                "description": "Brief one-sentence explanation of what bug you identified and what change you made to fix it. Example: 'Added abs() to calculate absolute distance between elements'"
-                            }
-                        },
-                        "required": ["code", "reason"]
-                    }
-                }
-            }
-        ]
+        # Stream replies so uncompilable code is caught before the reply finishes
+        self.stream_responses = stream_responses
+        
+        # Number of recent attempts kept verbatim in the message history
+        self.history_window = history_window
+        
+        # Tool schema for function calling (shared module constant)
+        self.tools = TOOLS
+    
+    def close(self):
+        """Close the pooled HTTP connections."""
+        if self._speculative_pool is not None:
+            self._speculative_pool.shutdown(wait=False, cancel_futures=True)
+        self._http_client.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def get_next_client(self):
-        """Get next client in round-robin fashion."""
-        client = self.clients[self.current_client_index]
-        client_num = self.current_client_index + 1
-        self.current_client_index = (self.current_client_index + 1) % len(self.clients)
+        """Get next client in round-robin fashion (safe to call from multiple threads)."""
+        with self._client_lock:
+            client = self.clients[self.current_client_index]
+            client_num = self.current_client_index + 1
+            self.current_client_index = (self.current_client_index + 1) % len(self.clients)
         return client, client_num
     
+    def model_for_iteration(self, iteration: int) -> str:
+        """
+        Use the draft model for the first draft_iterations attempts, then the main model.
+        
+        Every iteration before a success is a failed attempt (the first reply
+        is forced to call run_code), so this gives the draft model that many
+        tries, with its earlier test feedback, before the main model takes over.
+        """
+        if self.draft_model_name and iteration < self.draft_iterations:
+            return self.draft_model_name
+        return self.model_name
+    
+    def _create_completion(self, client, messages: List, temperature: float, tool_choice="auto", model: str = None):
+        """Call the chat API once, with built-in retries (rate-limit aware)."""
+        api_retry_count = 3
+        api_retry_delay = 1
+        
+        for api_attempt in range(api_retry_count):
+            try:
+                self.rate_limiter.acquire()
+                response = client.chat.completions.create(
+                    model=model or self.model_name,
+                    messages=messages,
+                    tools=self.tools,
+                    tool_choice=tool_choice,
+                    temperature=temperature,
+                    stream=self.stream_responses
+                )
+                if self.stream_responses:
+                    return self._collect_stream(response)
+                return response
+            except Exception as api_error:
+                if api_attempt < api_retry_count - 1:
+                    logger.warning("\nWARNING: API attempt %d failed: %s", api_attempt + 1, str(api_error)[:100])
+                    rate_limit_delay = retry_after_seconds(api_error)
+                    if rate_limit_delay is not None:
+                        # Rate limited: hold back every thread for exactly Retry-After
+                        logger.warning("   Rate limited, retrying in %ss...", rate_limit_delay)
+                        self.rate_limiter.pause(rate_limit_delay)
+                    else:
+                        logger.warning("   Retrying in %ss...", api_retry_delay)
+                        time.sleep(api_retry_delay)
+                        api_retry_delay *= 2  # Exponential backoff
+                else:
+                    # Last attempt failed, raise the error
+                    raise api_error
+    
+    @staticmethod
+    def _collect_stream(stream) -> ChatCompletion:
+        """
+        Assemble a streamed reply into the same shape as a regular completion.
+        
+        As soon as the first tool call's "code" argument has fully arrived it is
+        compiled; if it doesn't compile, run_code would only report the syntax
+        error, so the rest of the reply is skipped and the connection closed.
+        """
+        content = []
+        tool_calls = {}
+        code_checked = False
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                for tc in delta.tool_calls or []:
+                    call = tool_calls.setdefault(tc.index, {
+                        'id': None, 'type': 'function', 'index': tc.index,
+                        'function': {'name': '', 'arguments': ''}
+                    })
+                    call['id'] = getattr(tc, 'id', None) or call['id']
+                    function = getattr(tc, 'function', None)
+                    if function is not None:
+                        call['function']['name'] += getattr(function, 'name', None) or ''
+                        call['function']['arguments'] += getattr(function, 'arguments', None) or ''
+                
+                first_call = tool_calls.get(min(tool_calls)) if tool_calls else None
+                if not code_checked and first_call is not None:
+                    match = _CODE_ARGUMENT_RE.search(first_call['function']['arguments'])
+                    if match:
+                        code_checked = True
+                        code = json.loads(match.group(1))
+                        if not _EXECUTOR.validate_code(code)[0]:
+                            first_call['function']['arguments'] = _json_dumps({'code': code, 'reason': ''})
+                            tool_calls = {first_call['index']: first_call}
+                            break
+        finally:
+            stream.close()
+        
+        message = {
+            'role': 'assistant',
+            'content': ''.join(content) or None,
+            'tool_calls': [tool_calls[i] for i in sorted(tool_calls)] or None
+        }
+        return ChatCompletion.construct(choices=[{'index': 0, 'message': message}])
+    
+    @staticmethod
+    def _has_valid_tool_call(response) -> bool:
+        """True if the response calls run_code with code that compiles."""
+        tool_calls = response.choices[0].message.tool_calls
+        if not tool_calls:
+            return False
+        try:
+            code = _json_loads(tool_calls[0].function.arguments).get("code", "")
+        except (ValueError, AttributeError):
+            return False
+        return bool(code) and _EXECUTOR.validate_code(code)[0]
+    
+    def _speculative_completion(self, messages: List, temperature: float, tool_choice="auto", model: str = None):
+        """
+        Race speculative_calls requests on different keys and temperatures.
+        
+        The first response with a valid run_code call wins; if none has one,
+        the first successful response is used. Requests that haven't started
+        are cancelled and the rest are left to finish in the background, so a
+        slow or rate-limited key never holds up the iteration.
+        """
+        temperatures = [temperature] + [t for t in (0.3, 0.5, 0.7) if t != temperature]
+        # Losing requests may still be sent later (after a rate-limit wait or a
+        # retry), when fix_code has already appended to or pruned messages, so
+        # they get a snapshot; pruning replaces list items, never the dicts
+        snapshot = list(messages)
+        futures = []
+        for k in range(self.speculative_calls):
+            client, _ = self.get_next_client()
+            futures.append(self._speculative_pool.submit(
+                self._create_completion, client, snapshot, temperatures[k % len(temperatures)], tool_choice, model))
+        
+        fallback = None
+        last_error = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if self._has_valid_tool_call(response):
+                    return response
+                if fallback is None:
+                    fallback = response
+        finally:
+            for future in futures:
+                future.cancel()
+        
+        if fallback is not None:
+            return fallback
+        raise last_error
+    
     def fix_code(self, 
                  buggy_code: str, 
                  error_description: str = "", 
@@ -291,111 +673,45 @@ class TogetherCodeFixAgent:
         Returns:
             Fixed code
         """
-        self.observer.start_session(task_id)
-        self.observer.log("FIX_START", f"Starting code fix with Together AI ({self.model_name})", level="AGENT")
+        # A fresh observer per session: concurrent fix_code calls would otherwise
+        # share timers and logs. self.observer points at the latest session.
+        observer = self.observer = AgentObserver(verbose=self.verbose)
+        observer.start_session(task_id)
+        observer.log("FIX_START", f"Starting code fix with Together AI ({self.model_name})", level="AGENT")
         
-        print(f"\n{'='*70}")
-        print(f"TASK: {task_id}")
-        print(f"DESCRIPTION: {error_description}")
-        print(f"MODEL: {self.model_name}")
-        print(f"{'='*70}")
+        logger.info("\n%s\nTASK: %s\nDESCRIPTION: %s\nMODEL: %s\n%s",
+                    _RULE, task_id, error_description, self.model_name, _RULE)
         
-        # Set global references for the tool
-        global _test_cases, _observer, _previous_code
-        _test_cases = test_cases or []
-        _observer = self.observer
-        _previous_code = None  # Reset for new session
+        # A fresh tool per session, bound to this task's tests
+        run_code_tool = make_run_code_tool(test_cases or [], observer)
         
         # DEBUG: Verify test cases were set
         if self.verbose:
-            print(f"\nDEBUG: Setting _test_cases globally")
-            print(f"   _test_cases now has: {len(_test_cases)} tests")
-            if _test_cases:
-                print(f"   First test: {_test_cases[0]}")
+            logger.debug("\nDEBUG: Binding run_code to this task's test cases")
+            logger.debug("   test_cases now has: %d tests", len(test_cases or []))
+            if test_cases:
+                logger.debug("   First test: %s", test_cases[0])
         
-        # Build system message
-        system_message = """You are an expert Python debugging agent with access to a code execution sandbox.
-
-YOUR MISSION: Fix buggy Python code by analyzing it, identifying bugs, and testing fixes iteratively.
-
-AVAILABLE TOOL:
-- run_code(code: str, reason: str): Executes your code against predefined test cases
-  Returns: {"success": bool, "tests_passed": int, "tests_total": int, "error": str}
-
-WORKFLOW:
-1. READ the buggy code carefully
-2. ANALYZE what tests expect vs what code does
-3. IDENTIFY the bug(s)
-4. CALL run_code with your fixed code + brief explanation
-5. READ the test results:
-   - All pass -> STOP (you're done!)
-   - Some fail -> Analyze failures, try DIFFERENT fix, go to step 4
-6. ITERATE until all tests pass (max 10 attempts)
-
-CRITICAL RULES:
-- ALWAYS call run_code - never just explain the fix
-- Each attempt must try something DIFFERENT (don't repeat same code)
-- Read error messages carefully - they tell you what's wrong
-- When all tests pass, STOP immediately (don't call again)
-- Keep your 'reason' brief (1 sentence) - save tokens for code
-
-COMMON BUG PATTERNS & FIXES:
-1. Missing absolute value:
-   Bug: distance = elem1 - elem2
-   Fix: distance = abs(elem1 - elem2)
-
-2. Wrong comparison operator:
-   Bug: if distance < threshold (when should be <=)
-   Fix: if distance <= threshold
-
-3. Off-by-one in loops:
-   Bug: for i in range(len(arr) - 1)
-   Fix: for i in range(len(arr))
-
-4. Not handling spaces/whitespace:
-   Bug: for c in string: process(c)
-   Fix: for c in string: if c != ' ': process(c)
-
-5. Adding instead of just returning:
-   Bug: return value + 1.0
-   Fix: return value
-
-EXAMPLE FIX:
-Buggy: def has_close(nums, threshold): return any(n1-n2 < threshold for n1 in nums for n2 in nums)
-Fixed: def has_close(nums, threshold): return any(abs(n1-n2) < threshold for i, n1 in enumerate(nums) for j, n2 in enumerate(nums) if i != j)
-Reason: Added abs() and excluded same-element comparisons
-
-NOW: Call run_code with your first fix attempt!"""
         
         # Build user message with ALL test cases (no truncation for 70B model)
         test_info = ""
         if test_cases:
-            test_info = "\n\nTEST CASES (Your code must pass ALL of these):\n"
-            for i, t in enumerate(test_cases, 1):
-                test_info += f"  {i}. {t}\n"
+            test_info = "\n\nTEST CASES (Your code must pass ALL of these):\n" + "".join(
+                f"  {i}. {t}\n" for i, t in enumerate(test_cases, 1))
         
-        user_message = f"""BUGGY CODE TO FIX:
-
-```python
-{buggy_code}
-```
-{test_info}
-
-TASK: Fix the bug(s) in this code so it passes ALL test cases.
-
-ACTION: Call run_code NOW with:
-  - code: Your complete fixed version
-  - reason: One sentence explaining what you changed
-
-START NOW - Don't explain, just call the function!"""
+        user_message = USER_PROMPT_TEMPLATE.substitute(buggy_code=buggy_code, test_info=test_info)
 
+        # Frozen system prompt first, then the task, so every request shares a
+        # cacheable prefix. Later turns are appended, but once history_window
+        # attempts have passed _prune_messages collapses the oldest ones into
+        # summaries, and prefix reuse stops at the first collapsed message.
         messages = [
-            {"role": "system", "content": system_message},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_message}
         ]
         
         # Run agent loop
-        self.observer.log("AGENT_RUN", "Running Together AI agent...", level="AGENT")
+        observer.log("AGENT_RUN", "Running Together AI agent...", level="AGENT")
         
         tool_was_called = False
         final_code = None
@@ -403,12 +719,8 @@ START NOW - Don't explain, just call the function!"""
         
         for iteration_count in range(self.max_iterations):
             if self.verbose:
-                print(f"\n{'='*70}")
-                print(f"Iteration {iteration_count + 1}/{self.max_iterations}")
-                print(f"   Message history size: {len(messages)} messages")
-                if len(messages) > 10:
-                    print(f"   WARNING: Large message history may slow down API calls!")
-                print(f"{'='*70}")
+                logger.debug("\n%s\nIteration %d/%d\n   Message history size: %d messages\n%s",
+                             _RULE, iteration_count + 1, self.max_iterations, len(messages), _RULE)
             
             # Call Together AI
             max_retries = 3
@@ -421,30 +733,21 @@ START NOW - Don't explain, just call the function!"""
                     
                     # DETAILED: Show what we're sending to LLM
                     if self.verbose and iteration_count == 0 and retry_attempt == 0:
-                        print(f"\nSENDING TO LLM (first iteration):")
-                        print(f"{'='*70}")
+                        logger.debug("\nSENDING TO LLM (first iteration):")
+                        logger.debug("%s", _RULE)
                         for idx, msg in enumerate(messages):
                             role = msg.get('role', 'unknown')
-                            print(f"\n[Message {idx}] Role: {role}")
+                            logger.debug("\n[Message %d] Role: %s", idx, role)
                             if role == 'system':
                                 content = msg.get('content', '')
-                                print(f"Content:\n{content[:500]}...")
+                                logger.debug("Content:\n%s...", content[:500])
                             elif role == 'user':
                                 content = msg.get('content', '')
-                                print(f"Content:\n{content[:800]}...")
+                                logger.debug("Content:\n%s...", content[:800])
                             elif role == 'tool':
-                                print(f"Tool: {msg.get('name')}")
-                                print(f"Result: {msg.get('content')[:200]}...")
-                        print(f"{'='*70}\n")
-                    
-                    # Minimal output - just show we're calling
-                    if self.verbose and retry_attempt == 0:
-                        if len(self.clients) > 1:
-                            print(f"Calling API (key {client_num}/{len(self.clients)})...", end='', flush=True)
-                        else:
-                            print(f"Calling API...", end='', flush=True)
-                    elif self.verbose and retry_attempt > 0:
-                        print(f"Retry {retry_attempt + 1}/{max_retries} with key {client_num}...", end='', flush=True)
+                                logger.debug("Tool: %s", msg.get('name'))
+                                logger.debug("Result: %s...", msg.get('content')[:200])
+                        logger.debug("%s\n", _RULE)
                     
                     start_time = time.time()
 
@@ -456,72 +759,58 @@ START NOW - Don't explain, just call the function!"""
                     else:
                         temperature = 0.5  # Middle ground
                     
-                    # Direct API call with built-in retry mechanism
-                    api_retry_count = 3
-                    api_retry_delay = 1
-                    response = None
-                    
-                    for api_attempt in range(api_retry_count):
-                        try:
-                            response = current_client.chat.completions.create(
-                                model=self.model_name,
-                                messages=messages,
-                                tools=self.tools,
-                                tool_choice="auto",
-                                temperature=temperature
-                            )
-                            break  # Success!
-                        except Exception as api_error:
-                            if api_attempt < api_retry_count - 1:
-                                print(f"\nWARNING: API attempt {api_attempt + 1} failed: {str(api_error)[:100]}")
-                                print(f"   Retrying in {api_retry_delay}s...")
-                                time.sleep(api_retry_delay)
-                                api_retry_delay *= 2  # Exponential backoff
-                            else:
-                                # Last attempt failed, raise the error
-                                raise api_error
+                    # The first reply must call run_code; after that the model may stop
+                    tool_choice = FORCE_RUN_CODE if iteration_count == 0 else "auto"
+                    model = self.model_for_iteration(iteration_count)
+                    if self.speculative_calls > 1:
+                        response = self._speculative_completion(messages, temperature, tool_choice, model)
+                    else:
+                        response = self._create_completion(current_client, messages, temperature, tool_choice, model)
                     
                     elapsed = time.time() - start_time
                     
+                    # Minimal output - one line per call once it has returned
                     if self.verbose:
-                        print(f" ✓ ({elapsed:.1f}s)")
+                        attempt = f"Retry {retry_attempt + 1}/{max_retries}" if retry_attempt else "Called API"
+                        key = f" (key {client_num}/{len(self.clients)})" if len(self.clients) > 1 else ""
+                        logger.debug("%s%s with %s ✓ (%.1fs)", attempt, key, model, elapsed)
                     
                     # Success! Break out of retry loop
                     break
                     
                 except Exception as e:
                     error_msg = f"Together AI API Error (attempt {retry_attempt + 1}/{max_retries}): {str(e)}"
-                    self.observer.log("API_ERROR", error_msg, level="ERROR")
-                    print(f"\n{error_msg}")
+                    observer.log("API_ERROR", error_msg, level="ERROR")
+                    logger.warning("\n%s", error_msg)
                     
                     # Show more details about the error
                     if self.verbose:
-                        print(f"\nError details:")
-                        print(f"   Type: {type(e).__name__}")
-                        print(f"   Message: {str(e)}")
+                        logger.debug("\nError details:")
+                        logger.debug("   Type: %s", type(e).__name__)
+                        logger.debug("   Message: %s", e)
                         if hasattr(e, 'status_code'):
-                            print(f"   Status code: {e.status_code}")
+                            logger.debug("   Status code: %s", e.status_code)
                         
                         # Check common issues
                         error_str = str(e).lower()
                         if 'timeout' in error_str:
-                            print(f"\nAPI timeout - the call took too long")
-                            print(f"   Switching to next API key on retry...")
+                            logger.debug("\nAPI timeout - the call took too long")
+                            logger.debug("   Switching to next API key on retry...")
                         elif 'rate limit' in error_str or '429' in error_str:
-                            print(f"\nRate limit hit - waiting before retry...")
+                            logger.debug("\nRate limit hit - waiting before retry...")
                         elif 'api key' in error_str or '401' in error_str or '403' in error_str:
-                            print(f"\nAPI key issue - check your TOGETHER_API_KEY")
+                            logger.debug("\nAPI key issue - check your TOGETHER_API_KEY")
                         elif 'connection' in error_str:
-                            print(f"\nConnection issue - check your internet connection")
+                            logger.debug("\nConnection issue - check your internet connection")
                     
                     # If this was the last retry, give up
                     if retry_attempt == max_retries - 1:
-                        print(f"\nAll {max_retries} retry attempts failed - giving up")
+                        logger.warning("\nAll %d retry attempts failed - giving up", max_retries)
                         break
                     
                     # Wait before retrying
                     if self.verbose:
-                        print(f"\nWaiting {retry_delay} seconds before retry...")
+                        logger.debug("\nWaiting %s seconds before retry...", retry_delay)
                     time.sleep(retry_delay)
                     retry_delay *= 2  # Exponential backoff
                     continue
@@ -533,35 +822,35 @@ START NOW - Don't explain, just call the function!"""
             assistant_message = response.choices[0].message
             
             if self.verbose:
-                print(f"\nLLM Response:")
-                print(f"   Role: {assistant_message.role}")
+                logger.debug("\nLLM Response:")
+                logger.debug("   Role: %s", assistant_message.role)
                 if assistant_message.content:
-                    print(f"   Content ({len(assistant_message.content)} chars):")
-                    print(f"   >>> {assistant_message.content[:300]}...")
+                    logger.debug("   Content (%d chars):", len(assistant_message.content))
+                    logger.debug("   >>> %s...", assistant_message.content[:300])
                 else:
-                    print(f"   Content: <empty>")
+                    logger.debug("   Content: <empty>")
                 if assistant_message.tool_calls:
-                    print(f"   Tool calls: {len(assistant_message.tool_calls)}")
+                    logger.debug("   Tool calls: %d", len(assistant_message.tool_calls))
                     for tc in assistant_message.tool_calls:
-                        print(f"      - {tc.function.name}")
+                        logger.debug("      - %s", tc.function.name)
                         # Show tool call arguments
                         try:
-                            args = json.loads(tc.function.arguments)
-                            print(f"        Args: {list(args.keys())}")
+                            args = _json_loads(tc.function.arguments)
+                            logger.debug("        Args: %s", list(args.keys()))
                             if 'reason' in args:
-                                print(f"        Reason: {args['reason'][:100]}...")
+                                logger.debug("        Reason: %s...", args['reason'][:100])
                             if 'code' in args:
-                                print(f"        Code length: {len(args['code'])} chars")
+                                logger.debug("        Code length: %d chars", len(args['code']))
                         except:
                             pass
                 else:
-                    print(f"   Tool calls: None [WARNING]")
+                    logger.debug("   Tool calls: None [WARNING]")
             
             # Add assistant message to history
             messages.append(assistant_message)
             
             if self.verbose:
-                print(f"\nAdded assistant message to history (now {len(messages)} messages)")
+                logger.debug("\nAdded assistant message to history (now %d messages)", len(messages))
             
             # Check if model called tools
             if assistant_message.tool_calls:
@@ -570,11 +859,11 @@ START NOW - Don't explain, just call the function!"""
                     # Process each tool call
                     for tool_call in assistant_message.tool_calls:
                         function_name = tool_call.function.name
-                        function_args = json.loads(tool_call.function.arguments)
+                        function_args = _json_loads(tool_call.function.arguments)
                         
                         if self.verbose:
-                            print(f"\nTOOL CALL: {function_name}")
-                            print(f"   Arguments: {list(function_args.keys())}")
+                            logger.debug("\nTOOL CALL: %s", function_name)
+                            logger.debug("   Arguments: %s", list(function_args.keys()))
                         
                         # Execute the tool
                         if function_name == "run_code":
@@ -592,33 +881,33 @@ START NOW - Don't explain, just call the function!"""
                                 "role": "tool",
                                 "tool_call_id": tool_call.id,
                                 "name": function_name,
-                                "content": json.dumps(tool_result)
+                                "content": _json_dumps(tool_result)
                             }
                             messages.append(tool_message)
+                            _prune_messages(messages, self.history_window)
                             
                             if self.verbose:
-                                print(f"\nAdded tool result to history (now {len(messages)} messages)")
-                                result_str = json.dumps(tool_result)
-                                print(f"   Tool result preview: {result_str[:150]}...")
+                                logger.debug("\nAdded tool result to history (now %d messages)", len(messages))
+                                logger.debug("   Tool result preview: %s...", tool_message['content'][:150])
                             
                             if self.verbose:
-                                print(f"\nTOOL RESULT:")
-                                print(f"   Success: {tool_result.get('success', False)}")
+                                logger.debug("\nTOOL RESULT:")
+                                logger.debug("   Success: %s", tool_result.get('success', False))
                                 if tool_result.get('success'):
-                                    print(f"   {tool_result.get('message', 'Tests passed!')}")
+                                    logger.debug("   %s", tool_result.get('message', 'Tests passed!'))
                                 else:
                                     error_preview = tool_result.get('error', 'Unknown error')
-                                    print(f"   Error: {error_preview}...")
-                                    print(f"   Tests passed: {tool_result.get('tests_passed', 0)}/{tool_result.get('tests_total', 0)}")
+                                    logger.debug("   Error: %s...", error_preview)
+                                    logger.debug("   Tests passed: %d/%d", tool_result.get('tests_passed', 0), tool_result.get('tests_total', 0))
                             
                             # Check if tests passed - if so, STOP!
                             if tool_result.get('success'):
                                 if self.verbose:
-                                    print(f"\nTests passed! Stopping agent loop.")
-                                self.observer.log("FIX_SUCCESS", "Code fix completed - all tests passed", level="SUCCESS")
+                                    logger.debug("\nTests passed! Stopping agent loop.")
+                                observer.log("FIX_SUCCESS", "Code fix completed - all tests passed", level="SUCCESS")
                                 
-                                summary = self.observer.get_summary()
-                                print(f"\nFix complete in {summary['total_time']:.2f}s")
+                                summary = observer.get_summary()
+                                logger.info("\nFix complete in %.2fs", summary['total_time'])
                                 
                                 return final_code if final_code else buggy_code
                             else:
@@ -628,33 +917,157 @@ START NOW - Don't explain, just call the function!"""
             else:
                 # Model didn't call tool - might be done or needs prompting
                 if self.verbose:
-                    print(f"\nWARNING: Model did NOT call any tools in iteration {iteration_count + 1}")
+                    logger.debug("\nWARNING: Model did NOT call any tools in iteration %d", iteration_count + 1)
                     if assistant_message.content:
-                        print(f"   Model said: {assistant_message.content}...")
+                        logger.debug("   Model said: %s...", assistant_message.content)
                 
-                if iteration_count == 0:
-                    # First iteration without tool call - force it
-                    if self.verbose:
-                        print(f"\nFORCING tool call with user prompt...")
-                    
-                    messages.append({
-                        "role": "user",
-                        "content": "STOP! You did NOT call run_code! Call it NOW with your best guess for the fix. Just call the function - no more thinking!"
-                    })
-                    continue
-                else:
-                    # Later iteration - model might think it's done
-                    if self.verbose:
-                        print(f"\nModel stopped calling tools - ending loop")
-                    break
+                # The first reply is forced to call run_code, so the model thinks it's done
+                if self.verbose:
+                    logger.debug("\nModel stopped calling tools - ending loop")
+                break
         
         # If we get here, either max iterations reached or something went wrong
         if final_code and len(final_code) > 20:
-            self.observer.log("FIX_PARTIAL", "Returning last submitted code (tests may not pass)", level="ERROR")
-            print(f"\nMax iterations reached - returning last code attempt")
+            observer.log("FIX_PARTIAL", "Returning last submitted code (tests may not pass)", level="ERROR")
+            logger.info("\nMax iterations reached - returning last code attempt")
             return final_code
         
-        self.observer.log("FIX_FAILED", "Could not fix code", level="ERROR")
-        print(f"\nFailed to fix code")
+        observer.log("FIX_FAILED", "Could not fix code", level="ERROR")
+        logger.info("\nFailed to fix code")
         return buggy_code
+    
+    def fix_many(self, task_specs: List[Dict], concurrency_per_key: int = 4) -> List[str]:
+        """
+        Run fix_code on many tasks concurrently, keeping every API key busy.
+        
+        Up to len(api_keys) * concurrency_per_key tasks are in flight at once;
+        they share this agent's rate limiter, while each fix_code call gets its
+        own run_code tool and observer, so tasks don't mix results or logs.
+        
+        Args:
+            task_specs: List of fix_code keyword arguments, one dict per task
+            concurrency_per_key: Tasks in flight per API key
+        
+        Returns:
+            Fixed code for each task, in the same order as task_specs
+        """
+        with ThreadPoolExecutor(max_workers=len(self.clients) * concurrency_per_key) as pool:
+            return list(pool.map(lambda spec: self.fix_code(**spec), task_specs))
+
+    def fix_code_batch(self, problems: List[Dict]) -> List[str]:
+        """
+        Fix several problems with a single API call (row-marshaling).
+        
+        All problems are packed into one numbered prompt and the model answers
+        with a JSON array of fixed code, which amortizes the per-request network
+        and queuing overhead. Each returned fix is checked against its tests;
+        problems whose fix fails (or if the response can't be parsed) fall back
+        to the regular iterative fix_code loop.
+        
+        Args:
+            problems: List of dicts with 'buggy_code', 'tests' and 'task_id'
+        
+        Returns:
+            Fixed code for each problem, in the same order
+        """
+        if len(problems) == 1:
+            problem = problems[0]
+            return [self.fix_code(buggy_code=problem['buggy_code'],
+                                  test_cases=problem['tests'],
+                                  task_id=problem['task_id'])]
+        
+        observer = AgentObserver(verbose=self.verbose)  # This batch's own log, like fix_code's sessions
+        
+        sections = []
+        for i, problem in enumerate(problems, 1):
+            section = f"### PROBLEM {i}\n\n```python\n{problem['buggy_code']}\n```\n"
+            if problem['tests']:
+                section += "\nTEST CASES:\n" + "\n".join(f"  {t}" for t in problem['tests']) + "\n"
+            sections.append(section)
+        
+        user_message = f"""Fix each of the following {len(problems)} buggy Python functions so they pass their test cases.
 
+{chr(10).join(sections)}
+Return ONLY a JSON array of {len(problems)} strings in a ```json fenced block.
+Element i must be the complete fixed code (imports, signature and body) for PROBLEM i."""
+        
+        messages = [
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": user_message}
+        ]
+        
+        response = None
+        max_retries = 3
+        retry_delay = 2  # seconds
+        
+        for retry_attempt in range(max_retries):
+            current_client, client_num = self.get_next_client()
+            try:
+                if self.verbose:
+                    logger.debug("Calling API with batch of %d problems (key %d/%d)...", len(problems), client_num, len(self.clients))
+                self.rate_limiter.acquire()
+                response = current_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=0.3
+                )
+                break
+            except Exception as e:
+                observer.log("API_ERROR", f"Batch API call failed (attempt {retry_attempt + 1}/{max_retries}): {str(e)[:100]}", level="ERROR")
+                if retry_attempt < max_retries - 1:
+                    rate_limit_delay = retry_after_seconds(e)
+                    if rate_limit_delay is not None:
+                        self.rate_limiter.pause(rate_limit_delay)
+                    else:
+                        time.sleep(retry_delay)
+                        retry_delay *= 2  # Exponential backoff
+        
+        # Only API errors are retried: a reply that can't be parsed goes straight
+        # to the per-problem fallback instead of re-sending the whole batch
+        fixes = None
+        if response is not None:
+            try:
+                fixes = self._parse_batch_response(response.choices[0].message.content, len(problems))
+            except ValueError as e:
+                observer.log("BATCH_PARSE_ERROR", str(e)[:100], level="ERROR")
+        
+        if fixes is None:
+            observer.log("BATCH_FALLBACK", "Could not parse batch response - fixing problems one by one", level="ERROR")
+            fixes = [None] * len(problems)
+        
+        results = []
+        for problem, fixed_code in zip(problems, fixes):
+            if fixed_code is not None and problem['tests']:
+                result = _EXECUTOR.execute_code_with_timeout(fixed_code, problem['tests'])
+                if result.get('success') and result.get('tests_passed') == result.get('tests_total'):
+                    observer.log("BATCH_PASS", f"{problem['task_id']}: batched fix passed all tests", level="SUCCESS")
+                    results.append(fixed_code)
+                    continue
+            
+            # Batched fix missing or failing - use the full agent loop for this one
+            results.append(self.fix_code(buggy_code=problem['buggy_code'],
+                                         test_cases=problem['tests'],
+                                         task_id=problem['task_id']))
+        
+        return results
+    
+    @staticmethod
+    def _parse_batch_response(content: str, expected_count: int) -> List[str]:
+        """Extract the JSON array of fixes from a batch response."""
+        if not content:
+            raise ValueError("Empty batch response")
+        
+        # Prefer a ```json fenced block, else take the outermost [...] span
+        start = content.find("```json")
+        if start != -1:
+            start += len("```json")
+            end = content.find("```", start)
+            payload = content[start:end if end != -1 else None]
+        else:
+            payload = content[content.find("["):content.rfind("]") + 1]
+        
+        fixes = _json_loads(payload)
+        if (not isinstance(fixes, list) or len(fixes) != expected_count
+                or not all(isinstance(f, str) for f in fixes)):
+            raise ValueError(f"Expected a JSON array of {expected_count} strings")
+        return fixes
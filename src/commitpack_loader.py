@@ -1,28 +1,62 @@
-"""
-Load and process CommitPackFT dataset (Python only)
-"""
-from datasets import load_dataset
-from typing import List, Dict
-import os
-import json
-from tqdm import tqdm
-
-
 """
 Load and process CommitPackFT dataset (Python only)
 
 Note: CommitPackFT uses deprecated dataset scripts. 
 We download the raw data from the bigcode/commitpack repository instead.
 """
-from datasets import load_dataset
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
 import json
-from tqdm import tqdm
+import hashlib
+import mmap
+from multiprocessing import Pool
 import subprocess
 
+# orjson reads and writes JSONL lines as bytes several times faster than json
+try:
+    from orjson import loads as json_loads, dumps as json_dumps
+except ImportError:  # Fall back to the stdlib json module (loads also accepts bytes)
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+# Byte range of a JSONL file filtered by one worker task. Small enough that
+# reaching max_samples early stops the scan without reading whole files.
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# Raw JSONL lines longer than this are skipped without being parsed. An
+# example passing the 50KB old_contents filter rarely needs more, so these are
+# almost always rejects, and the rest are whole-file rewrites, not bug fixes.
+MAX_LINE_BYTES = 210_000
 
-def download_raw_commitpack(output_dir: str = "data/commitpack_raw", num_files: int = 2):
+# Parallel LFS file transfers when pulling several data files at once
+LFS_CONCURRENT_TRANSFERS = 8
+
+# Where the raw bigcode/commitpack repository is cloned
+RAW_DIR = "data/commitpack_raw"
+
+# Part of every filtered-variant cache key; bump it when the filters change
+FILTER_VERSION = 1
+
+
+def _pull_python_files(repo_dir: str, num_files: int):
+    """
+    Pull the first num_files Python data files from LFS in one git-lfs call.
+    
+    A single pull with every file in --include lets git-lfs transfer them
+    concurrently over shared connections instead of one process per file.
+    """
+    file_patterns = [f"data/python/python-{i:04d}.jsonl" for i in range(1, num_files + 1)]
+    print(f"    Downloading {', '.join(file_patterns)} (one batched git lfs pull)...")
+    subprocess.run([
+        "git", "-c", f"lfs.concurrenttransfers={LFS_CONCURRENT_TRANSFERS}",
+        "lfs", "pull",
+        "--include", ",".join(file_patterns)
+    ], cwd=repo_dir, check=True)
+
+
+def download_raw_commitpack(output_dir: str = RAW_DIR, num_files: int = 2):
     """
     Download raw CommitPack data using git clone with LFS.
     
@@ -48,14 +82,7 @@ def download_raw_commitpack(output_dir: str = "data/commitpack_raw", num_files:
                     try:
                         # Pull only first N Python files to save bandwidth
                         # Each file contains thousands of examples
-                        file_patterns = [f"data/python/python-{i:04d}.jsonl" for i in range(1, num_files + 1)]
-                        
-                        for pattern in file_patterns:
-                            print(f"    Downloading {pattern}...")
-                            subprocess.run([
-                                "git", "lfs", "pull",
-                                "--include", pattern
-                            ], cwd=output_dir, check=True)
+                        _pull_python_files(output_dir, num_files)
                         
                         print(f"  ✓ Downloaded {num_files} Python data file(s)")
                     except subprocess.CalledProcessError as e:
@@ -93,14 +120,7 @@ def download_raw_commitpack(output_dir: str = "data/commitpack_raw", num_files:
         print(f"Step 3/3: Downloading {num_files} Python data file(s)...")
         try:
             # Download only the first N files (each has thousands of examples)
-            file_patterns = [f"data/python/python-{i:04d}.jsonl" for i in range(1, num_files + 1)]
-            
-            for i, pattern in enumerate(file_patterns, 1):
-                print(f"  [{i}/{num_files}] Downloading {pattern}...")
-                subprocess.run([
-                    "git", "lfs", "pull",
-                    "--include", pattern
-                ], cwd=output_dir, check=True)
+            _pull_python_files(output_dir, num_files)
             
             print(f"  ✓ Downloaded {num_files} Python data file(s)")
         except subprocess.CalledProcessError as e:
@@ -114,10 +134,183 @@ def download_raw_commitpack(output_dir: str = "data/commitpack_raw", num_files:
         return None
 
 
+def _filter_example(example: Dict) -> Optional[Dict]:
+    """Keep the CommitPackFT fields of a raw example, or None if it is filtered out."""
+    # Keep only relevant fields (same as CommitPackFT format)
+    filtered_example = {
+        'commit': example.get('commit', ''),
+        'old_file': example.get('old_file', ''),
+        'new_file': example.get('new_file', ''),
+        'old_contents': example.get('old_contents', ''),
+        'new_contents': example.get('new_contents', ''),
+        'subject': example.get('subject', ''),
+        'message': example.get('message', ''),
+    }
+    
+    # Basic filtering (following commitpackft_filters.py)
+    subject = filtered_example['subject'].strip().lower()
+    
+    # Skip if empty or too short
+    if len(subject) < 10 or len(subject.split()) < 4:
+        return None
+    
+    # Skip if old and new contents are the same
+    if filtered_example['old_contents'] == filtered_example['new_contents']:
+        return None
+    
+    # Skip if contents are too long
+    if len(filtered_example['old_contents']) > 50000:
+        return None
+    
+    return filtered_example
+
+
+def _scan_chunk(args) -> List[Dict]:
+    """
+    Filter the JSONL lines that start inside one byte range of a file.
+    
+    Runs in a worker process. A line belongs to the chunk its first byte is in,
+    so a line crossing the end is read here and skipped by the next chunk.
+    At most limit examples are returned, since the caller never needs more.
+    """
+    file_path, start, end, limit = args
+    examples = []
+    # Lines are sliced straight out of the mapped file: no per-line buffered
+    # reads, and oversized lines are never copied at all
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        end = min(end, size)
+        position = start
+        if start:
+            # Skip the rest of a line that began in the previous chunk
+            position = mm.find(b"\n", start - 1) + 1
+            if not position:
+                return examples
+        while position < end and len(examples) < limit:
+            newline = mm.find(b"\n", position)
+            line_end = newline if newline != -1 else size
+            line_start, position = position, line_end + 1
+            # Cheap gate before parsing: such a line can only hold an old/new
+            # pair far beyond the 50KB old_contents limit or a huge rewrite
+            if line_end - line_start > MAX_LINE_BYTES:
+                continue
+            try:
+                example = _filter_example(json_loads(mm[line_start:line_end]))
+            except json.JSONDecodeError:
+                continue
+            if example is not None:
+                examples.append(example)
+    return examples
+
+
+def _python_data_dir(repo_dir: str) -> str:
+    """Directory holding the Python JSONL files of a CommitPack clone."""
+    python_dir = os.path.join(repo_dir, "data", "python")
+    if not os.path.exists(python_dir):
+        # Try alternative locations
+        python_dir = os.path.join(repo_dir, "python")
+    return python_dir
+
+
+def _jsonl_files(python_dir: str) -> List[str]:
+    """Sorted paths of the JSONL files in python_dir (one directory read, no per-file stat)."""
+    with os.scandir(python_dir) as entries:
+        return sorted(entry.path for entry in entries
+                      if entry.name.endswith(".jsonl") and not entry.name.startswith(".")
+                      and entry.is_file())
+
+
+def _source_signature(python_files: List[str]) -> str:
+    """Name, size and mtime of every raw data file, to detect changed sources."""
+    stats = ((os.path.basename(path), os.stat(path)) for path in python_files)
+    return "|".join(f"{name}:{st.st_size}:{st.st_mtime_ns}" for name, st in stats)
+
+
+def _variant_path(output_file: str, signature: str, max_samples: int):
+    """Cache key and file of the filtered variant for these sources and settings."""
+    key = hashlib.sha1(f"{signature}:{max_samples}:v{FILTER_VERSION}".encode()).hexdigest()[:12]
+    root, ext = os.path.splitext(output_file)
+    return key, f"{root}_{key}{ext}"
+
+
+def _index_path(output_file: str) -> str:
+    return os.path.join(os.path.dirname(output_file) or ".", "index.json")
+
+
+def _read_index(output_file: str) -> Dict:
+    """Cached variants by key (file, max_samples, count, sources)."""
+    try:
+        with open(_index_path(output_file), 'rb') as f:
+            return json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def _register_variant(output_file: str, key: str, variant: str, signature: str, max_samples: int, count: int):
+    """Record a variant in index.json and point output_file at it."""
+    index = _read_index(output_file)
+    index[key] = {
+        'file': os.path.basename(variant),
+        'max_samples': max_samples,
+        'count': count,
+        'sources': signature,
+        'filter_version': FILTER_VERSION,
+    }
+    tmp_path = _index_path(output_file) + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(json_dumps(index))
+    os.replace(tmp_path, _index_path(output_file))
+    
+    # output_file stays the stable name callers load; it links to the latest variant
+    tmp_path = output_file + ".tmp"
+    try:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        os.symlink(os.path.basename(variant), tmp_path)
+    except OSError:  # No symlink support: fall back to a copy
+        import shutil
+        shutil.copyfile(variant, tmp_path)
+    os.replace(tmp_path, output_file)
+
+
+def _reuse_cached_variant(output_file: str, signature: str, max_samples: int) -> bool:
+    """
+    Point output_file at a cached variant for these sources and max_samples.
+    
+    Filtering keeps file order, so a variant built with a larger max_samples
+    also serves a smaller one: its first max_samples lines are copied out.
+    Returns False if nothing cached fits.
+    """
+    key, variant = _variant_path(output_file, signature, max_samples)
+    index = _read_index(output_file)
+    if key in index and os.path.exists(variant):
+        _register_variant(output_file, key, variant, signature, max_samples, index[key]['count'])
+        return True
+    
+    data_dir = os.path.dirname(output_file) or "."
+    for entry in index.values():
+        larger = os.path.join(data_dir, entry['file'])
+        exhaustive = entry['count'] < entry['max_samples']  # Holds every example that passes
+        if (entry['sources'] == signature and entry.get('filter_version') == FILTER_VERSION
+                and entry['max_samples'] >= max_samples and (entry['count'] >= max_samples or exhaustive)
+                and os.path.exists(larger)):
+            count = 0
+            with open(larger, 'rb') as src, open(variant, 'wb') as dst:
+                for line in src:
+                    if count >= max_samples:
+                        break
+                    dst.write(line)
+                    count += 1
+            _register_variant(output_file, key, variant, signature, max_samples, count)
+            return True
+    return False
+
+
 def download_and_filter_commitpack(
     output_file: str = "data/commitpack_python.jsonl",
     max_samples: int = 1000,
-    force_download: bool = False
+    force_download: bool = False,
+    num_proc: int = None
 ):
     """
     Download CommitPack and filter for Python-only examples.
@@ -129,18 +322,28 @@ def download_and_filter_commitpack(
         output_file: Where to save filtered Python examples
         max_samples: Maximum number of Python samples to save
         force_download: Re-download even if file exists
+        num_proc: Worker processes used to filter the files (default: CPU count)
     
     Returns:
         Path to output file, or None if download fails
     """
     
-    # Check if already downloaded
-    if os.path.exists(output_file) and not force_download:
-        print(f"✓ Filtered dataset already exists at: {output_file}")
-        with open(output_file, 'r') as f:
-            count = sum(1 for _ in f)
-        print(f"  Contains {count} Python examples")
-        return output_file
+    # Check if already filtered. Variants are cached per source files, max_samples
+    # and filter version; without a local raw clone, an existing file is trusted.
+    if not force_download:
+        python_dir = _python_data_dir(RAW_DIR)
+        if os.path.isdir(python_dir):
+            python_files = _jsonl_files(python_dir)
+            reused = bool(python_files) and _reuse_cached_variant(
+                output_file, _source_signature(python_files), max_samples)
+        else:
+            reused = os.path.exists(output_file)
+        if reused:
+            print(f"✓ Filtered dataset already exists at: {output_file}")
+            with open(output_file, 'rb') as f:
+                count = sum(1 for _ in f)
+            print(f"  Contains {count} Python examples")
+            return output_file
     
     print("Downloading CommitPackFT dataset...")
     print("Note: This will download raw Python data from bigcode/commitpack")
@@ -155,12 +358,8 @@ def download_and_filter_commitpack(
             raise Exception("Failed to clone repository")
         
         # Look for Python data files
-        python_dir = os.path.join(repo_dir, "data", "python")
+        python_dir = _python_data_dir(repo_dir)
         
-        if not os.path.exists(python_dir):
-            # Try alternative locations
-            python_dir = os.path.join(repo_dir, "python")
-            
         if not os.path.exists(python_dir):
             print(f"✗ Python directory not found in repository")
             print(f"  Checked: {python_dir}")
@@ -172,9 +371,8 @@ def download_and_filter_commitpack(
                 print(f"    {os.listdir(repo_dir)}")
             raise Exception("Python data not found")
         
-        # Load Python JSONL files
-        import glob
-        python_files = glob.glob(os.path.join(python_dir, "*.jsonl"))
+        # Load Python JSONL files (sorted, so the cached variants are reproducible)
+        python_files = _jsonl_files(python_dir)
         
         if not python_files:
             print(f"✗ No JSONL files found in {python_dir}")
@@ -183,56 +381,41 @@ def download_and_filter_commitpack(
         print(f"\nFound {len(python_files)} Python data files")
         print(f"Loading and filtering to {max_samples} examples...")
         
+        from tqdm import tqdm  # Only needed when actually filtering, not for cache hits
+        
+        # Scan fixed-size byte ranges of every file in parallel; results come
+        # back in file order, so the first max_samples matches are kept as before
+        file_sizes = {file_path: os.path.getsize(file_path) for file_path in python_files}
+        chunks = [
+            (file_path, chunk_start, min(chunk_start + CHUNK_BYTES, size), max_samples)
+            for file_path, size in file_sizes.items()
+            for chunk_start in range(0, size, CHUNK_BYTES)
+        ]
         python_examples = []
         
-        for file_path in tqdm(python_files, desc="Loading files"):
-            if len(python_examples) >= max_samples:
-                break
-                
-            with open(file_path, 'r') as f:
-                for line in f:
-                    if len(python_examples) >= max_samples:
-                        break
-                    
-                    try:
-                        example = json.loads(line)
-                        
-                        # Keep only relevant fields (same as CommitPackFT format)
-                        filtered_example = {
-                            'commit': example.get('commit', ''),
-                            'old_file': example.get('old_file', ''),
-                            'new_file': example.get('new_file', ''),
-                            'old_contents': example.get('old_contents', ''),
-                            'new_contents': example.get('new_contents', ''),
-                            'subject': example.get('subject', ''),
-                            'message': example.get('message', ''),
-                        }
-                        
-                        # Basic filtering (following commitpackft_filters.py)
-                        subject = filtered_example['subject'].strip().lower()
-                        
-                        # Skip if empty or too short
-                        if len(subject) < 10 or len(subject.split()) < 4:
-                            continue
-                        
-                        # Skip if old and new contents are the same
-                        if filtered_example['old_contents'] == filtered_example['new_contents']:
-                            continue
-                        
-                        # Skip if contents are too long
-                        if len(filtered_example['old_contents']) > 50000:
-                            continue
-                        
-                        python_examples.append(filtered_example)
-                        
-                    except json.JSONDecodeError:
-                        continue
+        with Pool(num_proc or os.cpu_count()) as pool, \
+                tqdm(total=sum(file_sizes.values()), unit="B", unit_scale=True, desc="Filtering") as progress:
+            for chunk, examples in zip(chunks, pool.imap(_scan_chunk, chunks)):
+                python_examples.extend(examples)
+                progress.update(chunk[2] - chunk[1])
+                if len(python_examples) >= max_samples:
+                    break  # Leaving the pool terminates the workers still scanning
+        del python_examples[max_samples:]
         
-        # Save to file
-        print(f"\nSaving {len(python_examples)} Python examples to {output_file}...")
-        with open(output_file, 'w') as f:
-            for example in python_examples:
-                f.write(json.dumps(example) + '\n')
+        # Save to this configuration's variant file, then point output_file at it
+        signature = _source_signature(python_files)
+        key, variant = _variant_path(output_file, signature, max_samples)
+        print(f"\nSaving {len(python_examples)} Python examples to {variant}...")
+        with open(variant, 'wb') as f:
+            buffer = bytearray()
+            for i, example in enumerate(python_examples, 1):
+                buffer += json_dumps(example)
+                buffer += b"\n"
+                if i % 1000 == 0:
+                    f.write(buffer)
+                    buffer.clear()
+            f.write(buffer)
+        _register_variant(output_file, key, variant, signature, max_samples, len(python_examples))
         
         print(f"✓ Saved {len(python_examples)} Python examples")
         return output_file
@@ -264,11 +447,11 @@ def load_commitpack_python(
         return []
     
     examples = []
-    with open(file_path, 'r') as f:
+    with open(file_path, 'rb') as f:
         for i, line in enumerate(f):
             if max_samples and i >= max_samples:
                 break
-            example = json.loads(line)
+            example = json_loads(line)
             examples.append(example)
     
     print(f"Loaded {len(examples)} Python examples from CommitPackFT")
@@ -280,12 +463,13 @@ def convert_to_bugfix_format(commit_example: Dict) -> Dict:
     Convert CommitPackFT example to bug-fix format.
     
     The old_contents is treated as "buggy" code and new_contents as "fixed".
+    Filtered examples always carry every field (see _filter_example).
     """
     return {
-        'task_id': f"CommitPack/{commit_example['commit'][:8]}",
-        'prompt': commit_example.get('subject', 'Fix code issues'),
+        'task_id': 'CommitPack/' + commit_example['commit'][:8],
+        'prompt': commit_example['subject'],
         'buggy_code': commit_example['old_contents'],
         'fixed_code': commit_example['new_contents'],
-        'commit_message': commit_example.get('message', ''),
-        'file_name': commit_example.get('new_file', 'unknown.py')
+        'commit_message': commit_example['message'],
+        'file_name': commit_example['new_file']
     }
@@ -5,10 +5,121 @@ import sys
 import io
 import ast
 import traceback
+import types
+import pickle
+import threading
+import multiprocessing
+from functools import lru_cache
 from contextlib import redirect_stdout, redirect_stderr
 from typing import Dict, Any, Tuple
 
 
+@lru_cache(maxsize=4096)
+def _compile_test(test: str):
+    """
+    Compile a test statement once; the same asserts are re-run on every attempt.
+    
+    Returns (test_code, nested): nested is True when the test contains a
+    lambda, comprehension or generator expression, whose scopes look names
+    up in the globals only and never see a separate locals dict.
+    """
+    test_code = compile(test, '<string>', 'exec')
+    return test_code, any(isinstance(const, types.CodeType) for const in test_code.co_consts)
+
+
+@lru_cache(maxsize=128)
+def _compile_program(code: str):
+    """
+    Parse and compile submitted code once; the agent often resubmits the same program.
+    
+    Returns (code_obj, func_name), where func_name is the first top-level def,
+    else the first nested one (None if there is none). Raises SyntaxError.
+    """
+    tree = ast.parse(code)
+    func_name = next((node.name for node in tree.body if isinstance(node, ast.FunctionDef)), None)
+    if func_name is None:
+        func_name = next((node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)), None)
+    return compile(tree, '<string>', 'exec'), func_name
+
+
+@lru_cache(maxsize=4096)
+def _compile_assert_parts(test: str):
+    """
+    Compile the two sides of "assert call == expected" for failure reports.
+    
+    Returns (call_code, expected_code), or (None, None) unless the test is a
+    single assert of one == comparison (chained or other comparisons, string
+    literals containing "==" and assert messages are all handled by the AST).
+    """
+    try:
+        body = ast.parse(test).body
+    except SyntaxError:
+        return None, None
+    node = body[0] if len(body) == 1 else None
+    if (isinstance(node, ast.Assert) and isinstance(node.test, ast.Compare)
+            and len(node.test.ops) == 1 and isinstance(node.test.ops[0], ast.Eq)):
+        return (compile(ast.Expression(node.test.left), '<string>', 'eval'),
+                compile(ast.Expression(node.test.comparators[0]), '<string>', 'eval'))
+    return None, None
+
+
+# Names every executed program starts with; copied per run, so exec only adds
+# the program's own definitions to that run's namespace
+_SAFE_BUILTINS = {
+    '__builtins__': __builtins__,
+    'print': print,
+    'len': len,
+    'range': range,
+    'list': list,
+    'dict': dict,
+    'set': set,
+    'tuple': tuple,
+    'str': str,
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'abs': abs,
+    'max': max,
+    'min': min,
+    'sum': sum,
+    'sorted': sorted,
+    'enumerate': enumerate,
+    'zip': zip,
+    'map': map,
+    'filter': filter,
+}
+
+
+# Isolated runs fork where available, so a run starts from the already-imported
+# caller instead of re-importing everything; the child only runs the submitted
+# code and writes to a pipe
+_PROCESS_CONTEXT = multiprocessing.get_context(
+    'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+_START_LOCK = threading.Lock()  # One process start at a time; concurrent forks from threads race at-fork hooks
+
+
+def picklable_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Make an execute_code result safe to send to another process.
+    
+    expected/actual of a failed test can be anything the code returned
+    (generators, lambdas, ...); values that can't be pickled become their repr.
+    """
+    for failed in result.get('failed_tests', ()):
+        for key in ('expected', 'actual'):
+            try:
+                pickle.dumps(failed.get(key))
+            except Exception:
+                failed[key] = repr(failed[key])
+    return result
+
+
+def _execute_in_child(conn, timeout, code, test_cases):
+    """Worker process body: run the code and send the result dict back."""
+    conn.send(picklable_result(CodeExecutor(timeout).execute_code(code, test_cases)))
+    conn.close()
+
+
 class CodeExecutor:
     """Safe Python code executor with timeout and resource limits."""
     
@@ -36,9 +147,9 @@ class CodeExecutor:
             'passed_tests': []   # List of passed test details
         }
         
-        # Validate syntax first
+        # Validate syntax first; the compiled program and function name are cached
         try:
-            ast.parse(code)
+            code_obj, func_name = _compile_program(code)
         except SyntaxError as e:
             result['error'] = f"Syntax Error: {str(e)}"
             return result
@@ -49,32 +160,10 @@ class CodeExecutor:
         
         try:
             # Create a clean namespace
-            namespace = {
-                '__builtins__': __builtins__,
-                'print': print,
-                'len': len,
-                'range': range,
-                'list': list,
-                'dict': dict,
-                'set': set,
-                'tuple': tuple,
-                'str': str,
-                'int': int,
-                'float': float,
-                'bool': bool,
-                'abs': abs,
-                'max': max,
-                'min': min,
-                'sum': sum,
-                'sorted': sorted,
-                'enumerate': enumerate,
-                'zip': zip,
-                'map': map,
-                'filter': filter,
-            }
+            namespace = _SAFE_BUILTINS.copy()
             
             with redirect_stdout(stdout_buffer), redirect_stderr(stderr_buffer):
-                exec(code, namespace)
+                exec(code_obj, namespace)
             
             result['success'] = True
             result['output'] = stdout_buffer.getvalue()
@@ -85,22 +174,22 @@ class CodeExecutor:
                 
                 for i, test in enumerate(test_cases):
                     try:
-                        # Extract function name from code
-                        tree = ast.parse(code)
-                        func_name = None
-                        for node in ast.walk(tree):
-                            if isinstance(node, ast.FunctionDef):
-                                func_name = node.name
-                                break
-                        
                         if func_name and func_name in namespace:
                             # Try to extract expected value and actual value for better error messages
-                            test_namespace = namespace.copy()
+                            # Fresh locals per test keep its assignments out of the
+                            # shared namespace without copying the whole globals dict.
+                            # Nested scopes only see globals, so tests with one get a
+                            # copy of the namespace for both instead.
+                            test_code, nested = _compile_test(test)
+                            if nested:
+                                test_globals = test_locals = namespace.copy()
+                            else:
+                                test_globals, test_locals = namespace, {}
                             
                             # For assertions like: assert func(args) == expected
                             # Try to get both sides
                             try:
-                                exec(test, test_namespace)
+                                exec(test_code, test_globals, test_locals)
                                 # Test passed
                                 result['tests_passed'] += 1
                                 result['passed_tests'].append({
@@ -114,28 +203,22 @@ class CodeExecutor:
                                 actual_value = None
                                 expected_value = None
                                 
-                                try:
-                                    # Extract function call and expected from assertion
-                                    # e.g., "assert func(args) == expected"
-                                    if '==' in test:
-                                        parts = test.replace('assert ', '').split('==')
-                                        if len(parts) == 2:
-                                            call_part = parts[0].strip()
-                                            expected_part = parts[1].strip()
-                                            
-                                            # Evaluate the function call to get actual value
-                                            try:
-                                                actual_value = eval(call_part, test_namespace)
-                                            except:
-                                                pass
-                                            
-                                            # Evaluate expected value
-                                            try:
-                                                expected_value = eval(expected_part, test_namespace)
-                                            except:
-                                                pass
-                                except:
-                                    pass
+                                # Extract function call and expected from assertion
+                                # e.g., "assert func(args) == expected"
+                                call_code, expected_code = _compile_assert_parts(test)
+                                
+                                if call_code is not None:
+                                    # Evaluate the function call to get actual value
+                                    try:
+                                        actual_value = eval(call_code, test_globals, test_locals)
+                                    except Exception:
+                                        pass
+                                    
+                                    # Evaluate expected value
+                                    try:
+                                        expected_value = eval(expected_code, test_globals, test_locals)
+                                    except Exception:
+                                        pass
                                 
                                 # Build error message
                                 if actual_value is not None and expected_value is not None:
@@ -203,6 +286,65 @@ class CodeExecutor:
         
         return result
     
+    def execute_code_with_timeout(self, code: str, test_cases: list = None) -> Dict[str, Any]:
+        """
+        Like execute_code, but in a separate process that is killed after self.timeout seconds.
+        
+        Use this wherever nothing else bounds the run time (an infinite loop in
+        the code would otherwise hang the calling thread for good).
+        """
+        try:
+            _compile_program(code)  # Compile here so forked children inherit the cache entry
+        except SyntaxError:
+            pass  # Reported by the child
+        
+        parent_conn, child_conn = _PROCESS_CONTEXT.Pipe(duplex=False)
+        process = _PROCESS_CONTEXT.Process(target=_execute_in_child,
+                                           args=(child_conn, self.timeout, code, test_cases),
+                                           daemon=True)
+        with _START_LOCK:
+            process.start()
+        child_conn.close()
+        
+        result = None
+        timed_out = not parent_conn.poll(self.timeout)
+        if not timed_out:
+            try:
+                result = parent_conn.recv()
+            except EOFError:
+                pass  # Child died without sending a result
+        parent_conn.close()
+        
+        process.join(0 if timed_out else 1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        
+        if result is not None:
+            return result
+        
+        if timed_out:
+            error = f"Timeout: code did not finish within {self.timeout}s (infinite loop?)"
+        else:
+            error = f"Execution process exited unexpectedly (exit code {process.exitcode})"
+        tests = test_cases or []
+        failed_tests = [{
+            'test_number': i + 1,
+            'test': test,
+            'status': 'FAILED',
+            'error': error,
+            'type': 'TimeoutError' if timed_out else 'ExecutionError'
+        } for i, test in enumerate(tests)]
+        return {
+            'success': False,
+            'output': '',
+            'error': error,
+            'tests_passed': 0,
+            'tests_total': len(tests),
+            'failed_tests': failed_tests,
+            'passed_tests': []
+        }
+    
     def validate_code(self, code: str) -> Tuple[bool, str]:
         """
         Validate Python code syntax.
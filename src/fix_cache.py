@@ -0,0 +1,79 @@
+"""
+Persistent disk cache for agent fixes.
+
+Re-running an evaluation with the same model on the same problems would
+otherwise re-pay the full Together API latency and cost for every problem.
+"""
+import ast
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional
+
+
+def normalize_code(code: str) -> str:
+    """
+    Canonical form of code for cache keys.
+    
+    Round-trips through ast.unparse, which drops comments and normalizes
+    whitespace, quoting and parentheses, so inputs that differ only in
+    formatting share a key. Code that doesn't parse is returned stripped.
+    """
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        return code.strip()
+
+
+class FixCache:
+    """
+    Cache of fixed code keyed by (model, buggy_code, tests).
+    
+    With normalize=True (the default), code and tests are keyed by their
+    normalize_code form, so near-duplicates that differ only in comments or
+    formatting reuse the same fix.
+    """
+
+    def __init__(self, cache_dir: str = ".fixcache", normalize: bool = True):
+        self.cache_dir = cache_dir
+        self.normalize = normalize
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, model_name: str, buggy_code: str, tests: List[str]) -> str:
+        """Hash the inputs that determine the agent's fix."""
+        if self.normalize:
+            buggy_code = normalize_code(buggy_code)
+            tests = [normalize_code(test) for test in tests]
+        h = hashlib.blake2b(digest_size=20)
+        for part in (model_name, buggy_code, "\n".join(tests)):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')  # Separator so ("ab", "c") != ("a", "bc")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, model_name: str, buggy_code: str, tests: List[str]) -> Optional[str]:
+        """Return the cached fix, or None on a miss."""
+        path = self._path(self.make_key(model_name, buggy_code, tests))
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)['fixed_code']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, model_name: str, buggy_code: str, tests: List[str], fixed_code: str):
+        """Store a fix. Writes go through a temp file so readers never see partial JSON."""
+        path = self._path(self.make_key(model_name, buggy_code, tests))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'model': model_name, 'fixed_code': fixed_code}, f)
+        os.replace(tmp_path, path)
+
+    def discard(self, model_name: str, buggy_code: str, tests: List[str]):
+        """Drop a cached fix (e.g. one that no longer passes its tests)."""
+        try:
+            os.remove(self._path(self.make_key(model_name, buggy_code, tests)))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,57 @@
+"""
+Shared request rate limiting for Together API calls.
+
+With many worker threads issuing calls at once, the per-minute request
+limit is hit quickly and every 429 retry wastes seconds. Spacing requests
+just under the limit, and pausing all threads together when the API does
+push back, keeps throughput at the limit without retry storms.
+"""
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces requests to at most rpm per minute."""
+
+    def __init__(self, rpm: Optional[int] = None):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.requests = 0
+        self.start_time = time.monotonic()
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may send its next request."""
+        with self._lock:
+            slot = max(time.monotonic(), self._next_time)
+            self._next_time = slot + self.interval
+            self.requests += 1
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold back every caller for the given time (e.g. a 429's Retry-After)."""
+        with self._lock:
+            self._next_time = max(self._next_time, time.monotonic() + seconds)
+
+    def effective_rpm(self) -> float:
+        """Requests actually sent per minute since the limiter was created."""
+        elapsed = time.monotonic() - self.start_time
+        return self.requests / elapsed * 60 if elapsed > 0 else 0.0
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Return how long to back off for a rate-limit (429) error, or None for other errors.
+
+    Uses the response's Retry-After header when present, else a 1 second default.
+    """
+    response = getattr(error, 'response', None)
+    if getattr(error, 'status_code', None) != 429 and getattr(response, 'status_code', None) != 429:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
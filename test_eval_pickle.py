@@ -0,0 +1,33 @@
+"""
+Test that a failed test's values can always be sent back from a test worker
+
+Regression: run_tests returned expected/actual as-is, so a function returning
+a generator where a list was expected couldn't be pickled back to the parent
+and the problem was recorded as a crash instead of a failed test.
+"""
+from multiprocessing import Pool
+
+from eval_humanevalfix import init_test_worker, run_tests
+
+returns_generator = """
+def f(n):
+    return (i for i in range(n))
+"""
+
+test_cases = [
+    "assert f(3) == [0, 1, 2]",
+]
+
+
+def test_unpicklable_actual_value():
+    with Pool(1, initializer=init_test_worker, initargs=(5,)) as pool:
+        result = pool.apply_async(run_tests, (returns_generator, test_cases)).get(timeout=10)
+    assert result['tests_total'] == 1 and result['tests_passed'] == 0
+    failed = result['failed_tests'][0]
+    assert failed['expected'] == [0, 1, 2]  # Picklable values are kept as they are
+    assert failed['actual'].startswith("<generator object")
+
+
+if __name__ == "__main__":
+    test_unpicklable_actual_value()
+    print("OK - the failed test came back with the generator's repr")
@@ -0,0 +1,41 @@
+"""
+Test that the eval test workers' timeout survives a failed assert
+
+Regression: execute_code re-evaluates both sides of a failed assert for the
+error message. A bare except there swallowed the SIGALRM timeout, so a later
+test stuck in an infinite loop hung the worker forever.
+"""
+from multiprocessing import Pool
+
+from eval_humanevalfix import init_test_worker, run_tests
+
+# f(0) is slow enough that the alarm fires while its failed assert is re-evaluated,
+# f(1) never returns
+slow_then_stuck = """
+import time
+
+def f(x):
+    if x == 0:
+        time.sleep(0.7)
+        return 0
+    while True:
+        pass
+"""
+
+test_cases = [
+    "assert f(0) == 2",
+    "assert f(1) == 1",
+]
+
+
+def test_timeout_after_failed_assert():
+    # Leaving the pool terminates a hung worker, so a regression fails instead of hanging
+    with Pool(1, initializer=init_test_worker, initargs=(1,)) as pool:
+        result = pool.apply_async(run_tests, (slow_then_stuck, test_cases)).get(timeout=10)
+    assert not result['success']
+    assert result['error'].startswith("Timeout")
+
+
+if __name__ == "__main__":
+    test_timeout_after_failed_assert()
+    print("OK - the timeout fired after the failed assert")
@@ -2,12 +2,18 @@
 Test the Together AI agent implementation
 """
 import os
+import logging
 from dotenv import load_dotenv
 from src.agent import TogetherCodeFixAgent
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Show the agent's progress and (with verbose=True) its step-by-step details
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logging.getLogger("src.agent").setLevel(logging.DEBUG)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 # Simple test case
 buggy_code = """
 def add_numbers(a, b):